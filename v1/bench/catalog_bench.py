@@ -0,0 +1,97 @@
+# benchmark: the ORM path the table endpoints used (query + .all()) against the
+# in-memory CatalogIndex (webapp/catalog.py), on the local info.db scaled up 1x,
+# 100x and 1000x. copies get a subject suffix and a year offset so (subject, level,
+# year) stays unique.
+#
+# run from v1/: python -m bench.catalog_bench
+import math
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from flask import Flask
+from config import data_path
+from webapp.models import db, Contest
+from webapp.catalog import CatalogIndex
+
+RUNS = 7
+COLUMNS = (Contest.id, Contest.subject, Contest.level, Contest.year, Contest.level_sort,
+           Contest.pdf_link, Contest.zip_link, Contest.other_link)
+
+
+def main():
+    with sqlite3.connect(data_path / "info.db") as conn:
+        base_rows = conn.execute(
+            'SELECT subject, level, year, level_sort, pdf_link, zip_link, other_link FROM contests'
+        ).fetchall()
+    print(f"{len(base_rows)} contests in {data_path / 'info.db'}")
+
+    def scaled(factor):
+        spread = math.isqrt(factor - 1) + 1 if factor > 1 else 1
+        for copy in range(factor):
+            suffix, offset = divmod(copy, spread)
+            for subject, level, year, level_sort, *links in base_rows:
+                yield (f"{subject} {suffix}" if suffix else subject, level, year - 100 * offset, level_sort, *links)
+
+    def timed(fn):
+        samples = []
+        for _ in range(RUNS):
+            started = time.perf_counter()
+            result = fn()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples), len(result)
+
+    for factor in (1, 100, 1000):
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            rows = list(scaled(factor))
+            db.session.execute(Contest.__table__.insert(), [
+                dict(zip(('subject', 'level', 'year', 'level_sort', 'pdf_link', 'zip_link', 'other_link'), row))
+                for row in rows
+            ])
+            db.session.commit()
+
+            started = time.perf_counter()
+            index = CatalogIndex.from_rows(db.session.query(*COLUMNS).all())
+            load_ms = (time.perf_counter() - started) * 1000
+            subject = index.values['subject'][0]
+            years = index.values['year'][:3]
+            levels = index.values['level'][:2]
+
+            cases = {
+                "everything, default order": (
+                    lambda: db.session.query(Contest).order_by(
+                        Contest.subject, Contest.level_sort, Contest.level, Contest.year.desc()).all(),
+                    lambda: index.query()),
+                "one subject, year desc": (
+                    lambda: db.session.query(Contest).filter(Contest.subject.in_([subject]))
+                    .order_by(Contest.year.desc()).all(),
+                    lambda: index.query(subjects=[subject], sort_by='year', sort_dir='desc')),
+                "3 years x 2 levels, subject": (
+                    lambda: db.session.query(Contest).filter(Contest.year.in_(years), Contest.level.in_(levels))
+                    .order_by(Contest.subject.asc()).all(),
+                    lambda: index.query(years=years, levels=levels, sort_by='subject')),
+            }
+            print(f"\n{factor}x: {len(index)} rows, index built in {load_ms:.0f} ms")
+            for name, (orm, memory) in cases.items():
+                orm_ms, orm_rows = timed(lambda: (db.session.expunge_all(), orm())[1])
+                mem_ms, mem_rows = timed(memory)
+                assert orm_rows == mem_rows, (name, orm_rows, mem_rows)
+                print(f"  {name:<30} {mem_rows:>7} rows   orm {orm_ms:9.2f} ms   memory {mem_ms:8.3f} ms"
+                      f"   {orm_ms / mem_ms:6.0f}x")
+            facet_ms, _ = timed(lambda: index.facet_counts())
+            filtered_ms, _ = timed(lambda: index.facet_counts(subjects=[subject], years=years))
+            print(f"  facet counts: unfiltered {facet_ms:.3f} ms, subject + 3 years {filtered_ms:.3f} ms")
+            db.session.remove()
+            db.engine.dispose()
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# benchmarks of the download transports (webapp/transport.py) against local stub
+# hosts. every new connection costs CONNECT_COST (standing in for DNS + TCP + TLS)
+# and every request REQUEST_LATENCY.
+#   1. first-click latency with and without warm-up (http/1.1)
+#   2. a batch of 200 small files over http/1.1 vs http/2 (needs httpx[http2])
+#
+# run from v1/: python -m bench.transport_bench
+import asyncio
+import socket
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import webapp.transport as transport
+from webapp.transport import Http1Transport, Http2Transport, get_transport, warm_up
+
+CONNECT_COST = 0.08
+REQUEST_LATENCY = 0.02
+RUNS = 5
+BATCH_FILES = 200
+BATCH_WORKERS = 32
+BODY = b"x" * 16 * 1024
+
+
+def main():
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            time.sleep(CONNECT_COST)
+            super().setup()
+            # headers and body go out in separate writes; don't let nagle hold them back
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def _reply(self, body: bytes):
+            time.sleep(REQUEST_LATENCY)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(len(BODY)))
+            self.end_headers()
+            return body
+
+        def do_HEAD(self):
+            self._reply(b"")
+
+        def do_GET(self):
+            self.wfile.write(self._reply(BODY))
+
+        def log_message(self, *args):
+            pass
+
+    h1_server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=h1_server.serve_forever, daemon=True).start()
+    h1_origin = f"http://127.0.0.1:{h1_server.server_port}"
+
+    def first_click(warm: bool) -> float:
+        transport._transport = Http1Transport()
+        if warm:
+            warm_up([h1_origin])
+        started = time.monotonic()
+        with get_transport().get(h1_origin + "/packet.pdf", timeout=30) as response:
+            for _ in response.iter_bytes(8192):
+                pass
+        return time.monotonic() - started
+
+    cold = [first_click(False) for _ in range(RUNS)]
+    warm = [first_click(True) for _ in range(RUNS)]
+    print(f"first click, cold: {statistics.median(cold) * 1000:.1f} ms (median of {RUNS})")
+    print(f"first click, warm: {statistics.median(warm) * 1000:.1f} ms (median of {RUNS})")
+
+    def run_batch(transport, origin: str) -> float:
+        def fetch(i):
+            with transport.get(f"{origin}/file-{i}.pdf", timeout=30) as response:
+                return sum(len(chunk) for chunk in response.iter_bytes(8192))
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as pool:
+            total = sum(pool.map(fetch, range(BATCH_FILES)))
+        assert total == BATCH_FILES * len(BODY)
+        return time.monotonic() - started
+
+    h1_time = run_batch(Http1Transport(), h1_origin)
+    print(f"{BATCH_FILES} files over http/1.1: {h1_time:.2f}s")
+
+    try:
+        import h2.config
+        import h2.connection
+        import h2.events
+        h2_transport = Http2Transport(prior_knowledge=True)
+    except ImportError as e:
+        print(f"skipping http/2 benchmark: {e}")
+        return
+
+    async def handle_h2(reader, writer):
+        await asyncio.sleep(CONNECT_COST)
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        conn.initiate_connection()
+        pending: dict[int, bytes] = {}  # stream id -> body bytes still to send
+
+        def flush():
+            # send as much of each pending body as flow control allows
+            for stream_id in list(pending):
+                data = pending[stream_id]
+                window = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size)
+                while data and window > 0:
+                    chunk, data = data[:window], data[window:]
+                    conn.send_data(stream_id, chunk, end_stream=not data)
+                    window = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size)
+                if data:
+                    pending[stream_id] = data
+                else:
+                    del pending[stream_id]
+            writer.write(conn.data_to_send())
+
+        async def respond(stream_id: int):
+            await asyncio.sleep(REQUEST_LATENCY)
+            conn.send_headers(stream_id, [(":status", "200"), ("content-length", str(len(BODY)))])
+            pending[stream_id] = BODY
+            flush()
+
+        writer.write(conn.data_to_send())
+        while True:
+            data = await reader.read(65535)
+            if not data:
+                break
+            for event in conn.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    asyncio.ensure_future(respond(event.stream_id))
+            flush()
+            await writer.drain()
+        writer.close()
+
+    h2_ready = threading.Event()
+    h2_port = []
+
+    def serve_h2():
+        async def main():
+            server = await asyncio.start_server(handle_h2, "127.0.0.1", 0)
+            h2_port.append(server.sockets[0].getsockname()[1])
+            h2_ready.set()
+            await server.serve_forever()
+        asyncio.run(main())
+
+    threading.Thread(target=serve_h2, daemon=True).start()
+    h2_ready.wait()
+
+    h2_time = run_batch(h2_transport, f"http://127.0.0.1:{h2_port[0]}")
+    print(f"{BATCH_FILES} files over http/2:   {h2_time:.2f}s")
+    h1_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -88,6 +88,8 @@ def verify_config():
     config_data = {
         "default_download_dir": downloads_dir.as_posix(),
         "download_dir": downloads_dir.as_posix(),
+        # "http1" or "http2" (needs httpx[http2]; falls back to http1)
+        "http_transport": "http1",
     }
 
     ## check if exists
@@ -173,12 +175,26 @@ def verify_info_db():
     global data_path, updated_info
     print()
     import setup.buildDB as buildDB
-    # always build db (it is small enought to be fast)
-    if True or updated_info or not (data_path / "info.db").exists():
-        buildDB.create_database(data_path / "info.json", data_path / "info.db", interactive=False)
-        print("OK info.db created")
+    info_json, info_db = data_path / "info.json", data_path / "info.db"
+    # escape hatch: UILDL_REBUILD_DB=1 or --rebuild-db always rebuilds
+    force = os.environ.get("UILDL_REBUILD_DB") == "1" or "--rebuild-db" in sys.argv
+    started = time.perf_counter()
+    # a missing or old-schema db is built from scratch; a new info.json is merged in
+    # so contest ids stay the same across updates
+    if force or not buildDB.schema_is_current(info_db):
+        buildDB.create_database(info_json, info_db, interactive=False)
+        print(f"OK info.db created ({(time.perf_counter() - started) * 1000:.0f} ms)")
+    elif updated_info or not buildDB.database_is_current(info_json, info_db):
+        try:
+            changes = buildDB.repopulate_database(info_json, info_db)
+            print(f"OK info.db updated: {changes['inserted']} added, {changes['updated']} changed, "
+                  f"{changes['deleted']} removed ({(time.perf_counter() - started) * 1000:.0f} ms)")
+        except Exception as e:
+            print(f"xx could not update info.db ({e}). rebuilding...")
+            buildDB.create_database(info_json, info_db, interactive=False)
+            print(f"OK info.db created ({(time.perf_counter() - started) * 1000:.0f} ms)")
     else:
-        print("OK info.db exists")
+        print(f"OK info.db is up to date ({(time.perf_counter() - started) * 1000:.0f} ms)")
 
 def find_free_port(port_range=range(5000, 60000)):
     import socket
@@ -196,6 +212,9 @@ def start_flask_in_background(on_ready, on_error):
     """Initialize app, start Flask, then notify UI callbacks."""
     try:
         log("Starting initialization...")
+        # open connections to the catalog host(s) while the rest of startup runs
+        import webapp.transport
+        webapp.transport.start_warm_up(data_path / "info.json")
         verify_config()
         verify_info_json()
         verify_info_db()
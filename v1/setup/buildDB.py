@@ -1,11 +1,16 @@
 import json
 import os
+import hashlib
 import sqlite3
 from typing import Dict, List, Tuple, Optional, Any
 from dataclasses import dataclass, field
 from pathlib import Path
+from urllib.parse import unquote
 from setup.mylogging import LOGGER as logger
 
+# bump whenever the tables or indexes built below change, so existing databases get rebuilt
+SCHEMA_VERSION = 3
+
 # canonical level order for sorting
 _LEVEL_ORDER = [
     'study packet',
@@ -27,6 +32,106 @@ def _compute_level_sort(level_name: str) -> int:
     except ValueError:
         return 999
 
+def source_hash(info_json_path) -> str:
+    """sha256 of the info.json a database is built from."""
+    digest = hashlib.sha256()
+    with open(info_json_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _stamp(cursor, info_json_path):
+    """Record what the database was built from, for database_is_current()."""
+    cursor.executemany(
+        'INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)',
+        [('source_sha256', source_hash(info_json_path)), ('schema_version', str(SCHEMA_VERSION))]
+    )
+
+def _read_stamp(db_path) -> Optional[dict]:
+    """The database's source_sha256/schema_version stamp, or None if it can't be read."""
+    if not os.path.exists(db_path):
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{Path(db_path).as_posix()}?mode=ro", uri=True)
+        try:
+            return dict(conn.execute(
+                "SELECT key, value FROM metadata WHERE key IN ('source_sha256', 'schema_version')"
+            ).fetchall())
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.info(f"Could not read database stamp from {db_path}: {e}")
+        return None
+
+def schema_is_current(db_path) -> bool:
+    """True if db_path exists with the current schema, so repopulate_database() can merge into it."""
+    stamp = _read_stamp(db_path)
+    return stamp is not None and stamp.get('schema_version') == str(SCHEMA_VERSION)
+
+def database_is_current(info_json_path, db_path) -> bool:
+    """True if db_path was built from this exact info.json with the current schema."""
+    if not schema_is_current(db_path):
+        return False
+    try:
+        return _read_stamp(db_path).get('source_sha256') == source_hash(info_json_path)
+    except OSError as e:
+        logger.info(f"Could not hash {info_json_path}: {e}")
+        return False
+
+# full-text index over the catalog, rowid = contests.id. trigram matches any 3+ character
+# substring ("spel", "vocab", "cie_s"); sqlite before 3.34 lacks it and gets word tokens.
+SEARCH_TOKENIZERS = ('trigram', 'unicode61')
+
+def _create_search_index(cursor) -> Optional[str]:
+    """Create contests_fts if missing. Returns its tokenizer, or None if sqlite has no FTS5."""
+    row = cursor.execute("SELECT value FROM metadata WHERE key = 'search_tokenizer'").fetchone()
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'contests_fts'"
+    ).fetchone()
+    if exists:
+        if row:
+            return row[0]
+        cursor.execute('DROP TABLE contests_fts')  # tokenizer unknown; start over
+    for tokenizer in SEARCH_TOKENIZERS:
+        try:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE contests_fts USING fts5(subject, level, year, filenames, "
+                f"tokenize = '{tokenizer}')"
+            )
+        except sqlite3.OperationalError as e:
+            logger.info(f"Search index: tokenizer {tokenizer} unavailable ({e})")
+            continue
+        cursor.execute('INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)', ('search_tokenizer', tokenizer))
+        _index_for_search(cursor)
+        return tokenizer
+    logger.warning("SQLite was built without FTS5; search will fall back to LIKE")
+    return None
+
+def _search_row(contest_id, subject, level, year, *links):
+    # "https://.../files/academics/CIE_S_21.pdf" -> "CIE_S_21.pdf"
+    filenames = ' '.join(unquote(link.rsplit('/', 1)[-1]) for link in links if link)
+    return (contest_id, subject, level, str(year), filenames)
+
+def _index_for_search(cursor, contest_ids=None):
+    """(Re)write the search rows for contest_ids, or for every contest."""
+    if contest_ids is None:
+        cursor.execute('DELETE FROM contests_fts')
+        rows = cursor.execute(
+            'SELECT id, subject, level, year, pdf_link, zip_link, other_link FROM contests'
+        ).fetchall()
+    else:
+        contest_ids = list(contest_ids)
+        cursor.executemany('DELETE FROM contests_fts WHERE rowid = ?', [(i,) for i in contest_ids])
+        rows = []
+        for i in contest_ids:
+            rows += cursor.execute(
+                'SELECT id, subject, level, year, pdf_link, zip_link, other_link FROM contests WHERE id = ?', (i,)
+            ).fetchall()
+    cursor.executemany(
+        'INSERT INTO contests_fts (rowid, subject, level, year, filenames) VALUES (?, ?, ?, ?, ?)',
+        [_search_row(*row) for row in rows]
+    )
+
 @dataclass
 class Contest:
     """Represents a single contest event, with links categorized by type."""
@@ -306,6 +411,7 @@ def create_database(info_json_path: str, db_path: str, interactive: bool = True)
                 # insert version metadata
                 c.execute('INSERT INTO metadata (key, value) VALUES (?, ?)', ('version', str(version)))
                 logger.info(f"Database version set to: {version}")
+                _stamp(c, info_json_path)
                 
             except sqlite3.Error as e:
                 logger.error(f"Error inserting data: {e}")
@@ -320,6 +426,11 @@ def create_database(info_json_path: str, db_path: str, interactive: bool = True)
             except sqlite3.Error as e:
                 logger.error(f"Error creating index: {e}")
                 raise
+
+            logger.info("Creating search index...")
+            tokenizer = _create_search_index(c)
+            if tokenizer:
+                logger.info(f"Search index built ({tokenizer} tokenizer)")
             
             conn.commit()
             logger.info(f"Database creation completed successfully! Schema and data populated in {db_path}")
@@ -331,11 +442,16 @@ def create_database(info_json_path: str, db_path: str, interactive: bool = True)
         logger.error(f"An unexpected error occurred during database operations: {e}")
         raise
 
-def repopulate_database(info_json_path: str, db_path: str):
+def repopulate_database(info_json_path: str, db_path: str) -> Dict[str, int]:
     """
-    Repopulates both 'contests' and 'metadata' tables with fresh data from the JSON file
-    without dropping the table or the database file. This is safe to call
-    on a running application as it doesn't delete the DB file.
+    Merges fresh data from the JSON file into the 'contests' and 'metadata' tables
+    without dropping the table or the database file. Rows are matched on
+    (subject, level, year): new contests are inserted, contests whose links changed
+    are updated in place and vanished ones deleted, so the ids of everything else
+    stay the same. This is safe to call on a running application as it doesn't
+    delete the DB file.
+
+    Returns a summary: {'inserted', 'updated', 'deleted', 'unchanged', 'total'}.
     """
     logger.info(f"Starting database repopulation from {info_json_path} into {db_path}...")
     
@@ -344,7 +460,7 @@ def repopulate_database(info_json_path: str, db_path: str):
         # The _load_and_parse_json_data function logs the specific error.
         raise ValueError(f"Failed to parse {info_json_path}")
 
-    contests_to_insert = parsed_data_store['contests']
+    contests_to_merge = parsed_data_store['contests']
     version = parsed_data_store['version']
     
     try:
@@ -362,39 +478,69 @@ def repopulate_database(info_json_path: str, db_path: str):
             except sqlite3.Error as e:
                 logger.error(f"Error checking/altering schema for level_sort: {e}")
                 raise
-            
-            logger.info("Deleting all existing entries from 'contests' table.")
-            c.execute('DELETE FROM contests')
-            
-            logger.info("Updating metadata...")
-            c.execute('INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)', ('version', str(version)))
-            
-            logger.info(f"Inserting {len(contests_to_insert)} new contest entries...")
-            insert_data = [
-                (
-                    entry.subject,
-                    entry.level,
-                    entry.year,
-                    _compute_level_sort(entry.level),
-                    entry.pdf_link,
-                    entry.zip_link,
-                    entry.other_link
+
+            # (subject, level, year) -> (id, (level_sort, pdf_link, zip_link, other_link))
+            existing = {
+                (row[1], row[2], row[3]): (row[0], tuple(row[4:]))
+                for row in c.execute(
+                    'SELECT id, subject, level, year, level_sort, pdf_link, zip_link, other_link FROM contests'
                 )
-                for entry in contests_to_insert
-            ]
+            }
+
+            inserts, updates = [], []
+            seen = set()
+            for entry in contests_to_merge:
+                key = (entry.subject, entry.level, entry.year)
+                seen.add(key)
+                values = (_compute_level_sort(entry.level), entry.pdf_link, entry.zip_link, entry.other_link)
+                current = existing.get(key)
+                if current is None:
+                    inserts.append(key + values)
+                elif current[1] != values:
+                    updates.append(values + (current[0],))
+            deletes = [(row_id,) for key, (row_id, _) in existing.items() if key not in seen]
+
+            logger.info(f"Merging contests: {len(inserts)} new, {len(updates)} changed, {len(deletes)} removed.")
+            c.executemany('DELETE FROM contests WHERE id = ?', deletes)
             c.executemany(
-                'INSERT INTO contests (subject, level, year, level_sort, pdf_link, zip_link, other_link) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                insert_data
+                'UPDATE contests SET level_sort = ?, pdf_link = ?, zip_link = ?, other_link = ? WHERE id = ?',
+                updates
             )
+            inserted_ids = []
+            for row in inserts:
+                c.execute(
+                    'INSERT INTO contests (subject, level, year, level_sort, pdf_link, zip_link, other_link) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    row
+                )
+                inserted_ids.append(c.lastrowid)
+
+            # keep the search index in step with just the rows that changed
+            had_search_index = c.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'contests_fts'"
+            ).fetchone()
+            if _create_search_index(c) and had_search_index:
+                c.executemany('DELETE FROM contests_fts WHERE rowid = ?', deletes)
+                _index_for_search(c, [row[-1] for row in updates] + inserted_ids)
+            
+            logger.info("Updating metadata...")
+            c.execute('INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)', ('version', str(version)))
+            _stamp(c, info_json_path)
 
             # ensure index for level_sort exists
             try:
                 c.execute('CREATE INDEX IF NOT EXISTS idx_contests_subject_levelsort_year ON contests(subject, level_sort, year)')
             except sqlite3.Error as e:
                 logger.warning(f"Could not create level_sort index (non-fatal): {e}")
-            
-        logger.info(f"Database repopulation completed successfully. Version: {version}")
-        return len(contests_to_insert)
+
+        summary = {
+            'inserted': len(inserts),
+            'updated': len(updates),
+            'deleted': len(deletes),
+            'unchanged': len(contests_to_merge) - len(inserts) - len(updates),
+            'total': len(contests_to_merge),
+        }
+        logger.info(f"Database repopulation completed successfully. Version: {version}. Changes: {summary}")
+        return summary
             
     except sqlite3.Error as e:
         logger.error(f"A database error occurred during repopulation: {e}")
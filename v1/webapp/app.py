@@ -3,20 +3,40 @@ if __name__ == '__main__':
     exit(1)
 
 import os
+import stat
+import errno
+import heapq
+import atexit
 import json
+import time
 import threading
 import shutil
+import hashlib
 import tempfile
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, url_for, make_response
+from werkzeug.datastructures import MultiDict
 from werkzeug.utils import secure_filename
-from sqlalchemy import func
+from sqlalchemy import func, and_, or_
+from sqlalchemy.exc import SQLAlchemyError
 from webapp.models import db, Contest
-from setup.buildDB import repopulate_database
 from setup.manageInfo import UpdateResult, update_info
 from setup.mylogging import LOGGER as logger
 from webapp.analytics import send_event, analytics_enabled
+from webapp.transport import get_transport
+from webapp.cache_index import CacheIndexStore
+from webapp.watcher import DirectoryWatcher
+from webapp import catalogdb
+from webapp.catalog import (CatalogIndex, contest_status, normalize_sort, sort_values,
+                            encode_cursor, decode_cursor)
+from webapp.search import search_ids
+from webapp.download_state import (DownloadStateMirror, download_state, status_rank, status_clause,
+                                   complete_clause, needs_inner_join)
+from webapp.fragments import FragmentCache
+from webapp.compression import ResponseCompressor, encodings, variant_tag
 from config import data_path
 
 
@@ -84,16 +104,15 @@ app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.abspath(data_path /
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 
-def get_database_version(db_path=data_path / "info.db"):
-    """Get the database version from the metadata table."""
-    import sqlite3
+def _catalog_db_path():
+    return app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
+
+def get_database_version():
+    """Get the database version from the metadata table (cached until the next refresh)."""
     try:
-        with sqlite3.connect(db_path) as conn:
-            c = conn.cursor()
-            c.execute('SELECT value FROM metadata WHERE key = ?', ('version',))
-            result = c.fetchone()
-            return int(result[0]) if result else None
-    except sqlite3.Error as e:
+        version = catalogdb.metadata().get('version')
+        return int(version) if version is not None else None
+    except SQLAlchemyError as e:
         logger.error(f"Error getting database version: {e}")
         return None
     except (ValueError, TypeError) as e:
@@ -103,6 +122,19 @@ def get_database_version(db_path=data_path / "info.db"):
 # Create tables within app context
 with app.app_context():
     db.create_all()
+    # refreshes swap info.db underneath the pool; let the swap see checked-out connections
+    catalogdb.attach_engine(db.engine)
+    # downloaded flags, joinable with contests for status filters and sorts in SQL
+    download_state_mirror = DownloadStateMirror(data_path / "download_state.db")
+    download_state_mirror.attach(db.engine)
+
+# compress text responses; the static assets are compressed once, up front
+compressor = ResponseCompressor(app.static_folder)
+compressor.precompress(['css/out.css', 'js/htmx.min.js', 'js/main.js'])
+
+@app.after_request
+def compress_response(response):
+    return compressor.process(response, request.accept_encodings, request.endpoint, request.view_args)
 
 # Create a semaphore to limit concurrent downloads
 download_semaphore = threading.Semaphore(4)  # Maximum 4 concurrent downloads
@@ -124,175 +156,1023 @@ def _get_download_lock(cache_key: str) -> threading.Lock:
         return _download_locks.setdefault(cache_key, threading.Lock())
 # -------------------------------------------------
 
+# ---------- batch planning utilities ----------
+# space left untouched on the target disk when planning a batch
+BATCH_FREE_SPACE_RESERVE = 50 * 1024 * 1024  # 50 MB
+BATCH_HEAD_WORKERS = 8
+# assumed size of a file not measured yet when nothing has been measured at all
+BATCH_UNKNOWN_SIZE_GUESS = 10 * 1024 * 1024  # 10 MB
+
+# known remote file sizes (url -> Content-Length), filled by HEAD probes and downloads
+_remote_sizes: dict[str, int] = {}
+_remote_sizes_lock = threading.Lock()
+
+# recent (bytes, seconds) samples used to estimate batch ETAs
+_throughput_samples = deque(maxlen=32)
+_throughput_lock = threading.Lock()
+
+
+def _remember_remote_size(url: str, headers) -> int | None:
+    """Record the Content-Length from a response's headers, if present."""
+    try:
+        size = int(headers.get('Content-Length'))
+    except (TypeError, ValueError):
+        return None
+    if size < 0:
+        return None
+    with _remote_sizes_lock:
+        _remote_sizes[url] = size
+    return size
+
+
+def _probe_remote_size(url: str) -> int | None:
+    """Return the size of a remote file, asking the server with HEAD if it is not known yet."""
+    with _remote_sizes_lock:
+        if url in _remote_sizes:
+            return _remote_sizes[url]
+
+    try:
+        headers = get_transport().head(url, timeout=10)
+        return _remember_remote_size(url, headers)
+    except Exception as e:
+        logger.warning(f"Could not determine size of {url}: {e}")
+        return None
+
+
+def _typical_remote_size() -> int:
+    """Mean of the remote sizes seen so far, as a stand-in for files not measured yet."""
+    with _remote_sizes_lock:
+        if not _remote_sizes:
+            return BATCH_UNKNOWN_SIZE_GUESS
+        return sum(_remote_sizes.values()) // len(_remote_sizes)
+
+
+def _record_throughput(num_bytes: int, seconds: float):
+    """Remember how fast a finished download went."""
+    if num_bytes > 0 and seconds > 0:
+        with _throughput_lock:
+            _throughput_samples.append((num_bytes, seconds))
+
+
+def _recent_throughput() -> float | None:
+    """Average bytes per second over the recent downloads, or None without samples."""
+    with _throughput_lock:
+        total_bytes = sum(b for b, _ in _throughput_samples)
+        total_seconds = sum(s for _, s in _throughput_samples)
+    if total_seconds <= 0:
+        return None
+    return total_bytes / total_seconds
+
+
+def _preallocate(file_obj, size: int | None):
+    """Reserve `size` bytes for an open file where the filesystem supports it.
+
+    Running out of space is raised so the download fails before any data is
+    written; filesystems that can't preallocate are silently skipped.
+    """
+    if not size or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(file_obj.fileno(), 0, size)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise
+        logger.debug(f"Preallocation not supported for {file_obj.name}: {e}")
+
+
+def _build_batch_plan(jobs, cache=None, probe=True):
+    """
+    Build a plan for a batch of (contest_item, link_type) jobs: the bytes to fetch,
+    the free space available and an ETA based on the recent throughput.
+
+    With probe=False, sizes not known yet are only asked for (with HEAD) when a guess
+    of them would bring the batch close to the free space; otherwise they are left
+    unknown and get recorded by the downloads themselves.
+    """
+    cache = cache or download_cache
+    downloads_dir = cache.downloads_dir
+    pending_urls = []
+    cached_files = 0
+    for contest_item, link_type in jobs:
+        cache_key = generate_cache_key(contest_item.subject, contest_item.level, contest_item.year, link_type)
+        if cache.is_cached(cache_key):
+            cached_files += 1
+            continue
+        url = getattr(contest_item, f"{link_type}_link")
+        if url:
+            pending_urls.append(url)
+    # a file picked twice is fetched once, so it is sized and counted once
+    pending_urls = list(dict.fromkeys(pending_urls))
+
+    with _remote_sizes_lock:
+        sizes = {url: _remote_sizes.get(url) for url in pending_urls}
+    unknown = [url for url, size in sizes.items() if size is None]
+    downloads_usage = shutil.disk_usage(downloads_dir)
+    if unknown and not probe:
+        known_bytes = sum(size for size in sizes.values() if size is not None)
+        guessed_bytes = known_bytes + len(unknown) * _typical_remote_size()
+        probe = guessed_bytes + BATCH_FREE_SPACE_RESERVE > downloads_usage.free
+    if unknown and probe:
+        with ThreadPoolExecutor(max_workers=min(BATCH_HEAD_WORKERS, len(unknown))) as pool:
+            sizes.update(zip(unknown, pool.map(_probe_remote_size, unknown)))
+    sizes = list(sizes.values())
+
+    known_sizes = [s for s in sizes if s is not None]
+    known_bytes = sum(known_sizes)
+    largest_file = max(known_sizes, default=0)
+
+    fits = known_bytes + BATCH_FREE_SPACE_RESERVE <= downloads_usage.free
+    # files are staged in the temp dir first; if it lives on another disk it only
+    # needs room for the biggest file at a time
+    temp_free = None
+    try:
+        if os.stat(TEMP_DIR).st_dev != os.stat(downloads_dir).st_dev:
+            temp_free = shutil.disk_usage(TEMP_DIR).free
+            fits = fits and largest_file <= temp_free
+    except OSError as e:
+        logger.warning(f"Could not check temp directory space: {e}")
+
+    throughput = _recent_throughput()
+    return {
+        "files": len(pending_urls),
+        "cached_files": cached_files,
+        "known_bytes": known_bytes,
+        "unknown_size_files": len(sizes) - len(known_sizes),
+        "free_bytes": downloads_usage.free,
+        "temp_free_bytes": temp_free,
+        "reserve_bytes": BATCH_FREE_SPACE_RESERVE,
+        "fits": fits,
+        "throughput_bytes_per_sec": round(throughput) if throughput else None,
+        "eta_seconds": round(known_bytes / throughput, 1) if throughput else None,
+    }
+# -------------------------------------------------
+
+LINK_TYPES = ('pdf', 'zip', 'other')
+NOT_DOWNLOADED = (False, False, False)
+EVICT_GRACE_SECONDS = 120  # a file served this recently may still be streaming to the browser
+CACHE_READY_TIMEOUT = 60  # how long a download waits for a new directory's first index
+
+
+def _cache_key_base(subject, level, year):
+    """The part of a cache key shared by all files of one contest."""
+    return f"{subject.replace(' ', '-')}_{year}_{level.replace(' ', '-')}"
+
+
+def _parse_cache_key(file_key):
+    """Split a cache key into (contest key base, link type), or None for files we didn't name."""
+    base, _, link_type = file_key.rpartition('_')
+    if not base or link_type not in LINK_TYPES:
+        return None
+    return base, link_type
+
+
+def _split_key_base(base):
+    """(subject, year, level) of a contest key base, or None if it isn't one we'd have made."""
+    parts = base.split('_', 2)
+    if len(parts) != 3 or not all(parts) or not parts[1].isdigit():
+        return None
+    return tuple(parts)
+
+
+def _stats_buckets(file_key):
+    """(subject, link type) a cache entry is counted under in the breakdowns."""
+    parsed = _parse_cache_key(file_key)
+    if parsed is None:
+        return 'Unknown', 'unknown'
+    base, link_type = parsed
+    return base.split('_', 1)[0].replace('-', ' '), link_type
+
+
+class _CacheAggregates:
+    """
+    Running totals over the cache index, updated per entry so reading them is O(1).
+
+    Timestamps are ISO strings from the same formatter, so they order correctly as
+    strings. Oldest/newest use heaps with lazy deletion: removed timestamps are only
+    popped when they reach the top.
+    """
+
+    def __init__(self, index=None):
+        self.total_files = 0
+        self.total_size = 0
+        self.by_subject = {}  # subject -> [files, bytes]
+        self.by_type = {}     # link type -> [files, bytes]
+        self._timestamps = Counter()
+        self._oldest = []
+        self._newest = []
+        for key, info in (index or {}).items():
+            self.add(key, info)
+
+    def _bump(self, key, info, sign):
+        self.total_files += sign
+        self.total_size += sign * info['size']
+        subject, link_type = _stats_buckets(key)
+        for buckets, name in ((self.by_subject, subject), (self.by_type, link_type)):
+            bucket = buckets.setdefault(name, [0, 0])
+            bucket[0] += sign
+            bucket[1] += sign * info['size']
+            if bucket[0] == 0:
+                del buckets[name]
+
+    def add(self, key, info):
+        self._bump(key, info, 1)
+        ts = info['timestamp']
+        if self._timestamps[ts] == 0:
+            heapq.heappush(self._oldest, ts)
+            heapq.heappush(self._newest, _Desc(ts))
+        self._timestamps[ts] += 1
+
+    def remove(self, key, info):
+        self._bump(key, info, -1)
+        ts = info['timestamp']
+        self._timestamps[ts] -= 1
+        if self._timestamps[ts] <= 0:
+            del self._timestamps[ts]
+
+    def oldest(self):
+        while self._oldest and self._oldest[0] not in self._timestamps:
+            heapq.heappop(self._oldest)
+        return self._oldest[0] if self._oldest else None
+
+    def newest(self):
+        while self._newest and self._newest[0].value not in self._timestamps:
+            heapq.heappop(self._newest)
+        return self._newest[0].value if self._newest else None
+
+
+class _Desc:
+    """Reverses ordering so heapq can be used as a max-heap of strings."""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+
 class DownloadCache:
     """Class to manage the download cache."""
-    CACHE_FILE = ".cache_manifest.json"
     
-    def __init__(self, downloads_dir=DOWNLOADS_DIR):
+    def __init__(self, downloads_dir=DOWNLOADS_DIR, defer_scan=False):
         self.downloads_dir = Path(downloads_dir)
         self.downloads_dir.mkdir(exist_ok=True)
         self._cache_index = {}
         self._cache_lock = threading.RLock()  # guard cache mutations
-        self._load_or_build_cache()
+        self._store = CacheIndexStore(self.downloads_dir)
+        self._dir_fingerprint = None
+        self._watcher = None
+        # contest key base -> contest ids, and contest id -> (pdf, zip, other) downloaded
+        self._contest_ids = {}
+        self._contest_states = {}
+        self.catalog_version = None
+        self.generation = 0  # bumped whenever the cached files or a contest's downloaded flags may have changed
+        self._aggregates = _CacheAggregates()
+        self._last_access = {}  # key -> unix time of the last download/use
+        self.ready = threading.Event()  # set once the index has been checked against the disk
+        self._loaded = False
+        self._load_or_build_cache(defer_scan)
         logger.info(f"Download cache initialized with {len(self._cache_index)} files")
     
-    def _build_cache_index(self):
-        """Build an index of already downloaded files by scanning the downloads directory."""
-        cache = {}
-        for file_path in self.downloads_dir.glob('*'):
-            if file_path.is_file() and file_path.name != self.CACHE_FILE:
+    def _scan_directory(self):
+        """List cache files as {key: os.DirEntry}. Reads the directory only, no per-file stat."""
+        entries = {}
+        with os.scandir(self.downloads_dir) as it:
+            for entry in it:
+                if entry.name in CacheIndexStore.RESERVED_NAMES or not entry.is_file():
+                    continue
                 # Use the filename without extension as the key
-                key = file_path.stem
-                cache[key] = {
-                    'path': str(file_path),
-                    'size': file_path.stat().st_size,
-                    'timestamp': datetime.fromtimestamp(file_path.stat().st_mtime).isoformat()
-                }
-        return cache
-    
-    def _save_cache_manifest(self):
-        """Save the cache index to the manifest file."""
-        cache_file_path = self.downloads_dir / self.CACHE_FILE
-        try:
-            with open(cache_file_path, 'w') as f:
-                json.dump(self._cache_index, f, indent=2)
-            logger.info(f"Cache manifest saved with {len(self._cache_index)} entries")
-        except Exception as e:
-            logger.error(f"Error saving cache manifest: {e}")
-    
-    def _load_or_build_cache(self):
-        """Load the cache from the manifest file or build it if not found."""
-        cache_file_path = self.downloads_dir / self.CACHE_FILE
-        
-        if cache_file_path.exists():
-            try:
-                with open(cache_file_path, 'r') as f:
-                    self._cache_index = json.load(f)
-                logger.info(f"Cache manifest loaded with {len(self._cache_index)} entries")
-                
-                # Verify that the files in the cache actually exist
-                # If any are missing, rebuild the cache
-                missing_files = []
-                for key, info in list(self._cache_index.items()):
-                    if not Path(info['path']).exists():
-                        missing_files.append(key)
-                
-                if missing_files:
-                    logger.warning(f"Found {len(missing_files)} missing files in cache manifest. Rebuilding cache.")
-                    self.rebuild_cache()
-                    
-            except (json.JSONDecodeError, IOError) as e:
-                logger.error(f"Error loading cache manifest: {e}. Rebuilding cache.")
-                self.rebuild_cache()
+                entries[os.path.splitext(entry.name)[0]] = entry
+        return entries
+
+    @staticmethod
+    def _entry_info(path, stat):
+        return {
+            'path': str(path),
+            'size': stat.st_size,
+            'timestamp': datetime.fromtimestamp(stat.st_mtime).isoformat()
+        }
+
+    def _fingerprint(self, file_count):
+        """Cheap summary of the directory: any create, delete or rename changes its mtime."""
+        return f"{os.stat(self.downloads_dir).st_mtime_ns}:{file_count}"
+
+    def _load_or_build_cache(self, defer_scan=False):
+        """
+        Load the cache from the index store (migrating an old manifest) and reconcile it
+        with the disk. With defer_scan only the load happens now (it is one query, and
+        lookups are right from then on); the disk check is left to settle().
+        """
+        self._load_index()
+        if not defer_scan:
+            self.settle()
+
+    def _load_index(self):
+        with self._cache_lock:
+            if self._loaded:
+                return
+            self._store.migrate_legacy_manifest()
+            if self._store.initialized:
+                self._cache_index = self._store.load()
+                self._aggregates = _CacheAggregates(self._cache_index)
+                self._last_access = self._store.load_access()
+                self._dir_fingerprint = self._store.get_meta('dir_fingerprint')
+                self._rebuild_contest_states()
+                logger.info(f"Cache index loaded with {len(self._cache_index)} entries")
+            self._loaded = True
+
+    @property
+    def indexed(self) -> bool:
+        """Whether lookups are complete: a saved index is loaded, or the first scan has finished."""
+        return self.ready.is_set() or (self._loaded and self._store.initialized)
+
+    def settle(self):
+        """Check the loaded index against the disk (building it on first use), then mark the cache ready."""
+        self._load_index()
+        if self._store.initialized:
+            self.reconcile()
         else:
-            logger.info("No cache manifest found. Building new cache.")
+            logger.info("No cache index found. Building new cache.")
             self.rebuild_cache()
-    
+        self.ready.set()
+
+    def reconcile(self, force=False):
+        """
+        Bring the index in line with the downloads directory, writing only the differences.
+
+        The directory is listed once. If its fingerprint (mtime, file count) matches the
+        one recorded last time, nothing changed and no file is stat'ed. Otherwise new
+        files are stat'ed once each and vanished ones dropped; with force=True every
+        file is re-stat'ed so in-place changes are picked up too.
+        """
+        started = time.monotonic()
+        dir_mtime = os.stat(self.downloads_dir).st_mtime_ns  # before listing, so a racing change forces another pass
+        on_disk = self._scan_directory()
+        fingerprint = f"{dir_mtime}:{len(on_disk)}"
+        summary = {'added': 0, 'removed': 0, 'updated': 0, 'skipped': False,
+                   'paths': []}  # files added or updated
+
+        with self._cache_lock:
+            if not force and fingerprint == self._dir_fingerprint:
+                summary['skipped'] = True
+            else:
+                for key, info in list(self._cache_index.items()):
+                    entry = on_disk.get(key)
+                    if entry is None or entry.path != info['path']:
+                        self._drop_entry(key)
+                        summary['removed'] += 1
+                for key, entry in on_disk.items():
+                    known = self._cache_index.get(key)
+                    if known is not None and not force:
+                        continue
+                    info = self._entry_info(entry.path, entry.stat())
+                    if known is None:
+                        summary['added'] += 1
+                    elif known != info:
+                        summary['updated'] += 1
+                    else:
+                        continue
+                    self._set_entry(key, info)
+                    summary['paths'].append(entry.path)
+                self._dir_fingerprint = fingerprint
+                self._store.queue_meta('dir_fingerprint', fingerprint)
+        if not summary['skipped']:
+            self._store.flush()
+
+        logger.info(f"Cache reconciled in {(time.monotonic() - started) * 1000:.1f} ms: "
+                    f"{summary['added']} added, {summary['removed']} removed, {summary['updated']} updated"
+                    f"{' (directory unchanged)' if summary['skipped'] else ''}")
+        return summary
+
     def rebuild_cache(self):
-        """Rebuild the cache by scanning the downloads directory."""
-        self._cache_index = self._build_cache_index()
-        self._save_cache_manifest()
+        """Rescan the downloads directory, re-stat'ing every file."""
+        if self._store.initialized:
+            self.reconcile(force=True)
+        else:
+            # first run: write the whole index in one go
+            with self._cache_lock:
+                on_disk = self._scan_directory()
+                self._replace_index({key: self._entry_info(entry.path, entry.stat()) for key, entry in on_disk.items()})
+                self._record_fingerprint(len(on_disk))
         logger.info(f"Cache rebuilt with {len(self._cache_index)} files")
         return len(self._cache_index)
-    
+
     def reset_cache(self):
         """Reset the cache (forget all downloads without deleting files)."""
-        old_count = len(self._cache_index)
-        self._cache_index = {}
-        self._save_cache_manifest()
+        with self._cache_lock:
+            old_count = len(self._cache_index)
+            self._replace_index({})
+            if self._watcher is not None:
+                self._watcher.discard_pending()
+            # the files stay on disk; fingerprint them so they aren't picked up again on restart
+            self._record_fingerprint(len(self._scan_directory()))
         logger.info(f"Cache reset. Forgot {old_count} files.")
         return old_count
-    
+
+    # all index mutations go through these three so the derived maps stay in step
+    def _set_entry(self, key, info):
+        old = self._cache_index.get(key)
+        if old is not None:
+            self._aggregates.remove(key, old)
+        self._cache_index[key] = info
+        self._aggregates.add(key, info)
+        self._store.put(key, info)
+        self._mark_contest(key, True)
+
+    def _drop_entry(self, key):
+        self._aggregates.remove(key, self._cache_index.pop(key))
+        self._last_access.pop(key, None)
+        self._store.delete(key)
+        self._mark_contest(key, False)
+
+    def _replace_index(self, index):
+        self._cache_index = index
+        self._aggregates = _CacheAggregates(index)
+        self._last_access = {}
+        self._store.replace_all(index)
+        self._rebuild_contest_states()
+
+    def register_contests(self, rows, version):
+        """Map catalog rows (id, subject, level, year) to their cache keys and recompute the state map."""
+        contest_ids = {}
+        for contest_id, subject, level, year in rows:
+            contest_ids.setdefault(_cache_key_base(subject, level, year), []).append(contest_id)
+        with self._cache_lock:
+            self._contest_ids = contest_ids
+            self._rebuild_contest_states()
+            self.catalog_version = version
+
+    def _rebuild_contest_states(self):
+        states = {}
+        for key in self._cache_index:
+            parsed = _parse_cache_key(key)
+            if parsed is None:
+                continue
+            base, link_type = parsed
+            for contest_id in self._contest_ids.get(base, ()):
+                flags = list(states.get(contest_id, NOT_DOWNLOADED))
+                flags[LINK_TYPES.index(link_type)] = True
+                states[contest_id] = tuple(flags)
+        self._contest_states = states
+        self.generation += 1
+
+    def _mark_contest(self, key, downloaded):
+        self.generation += 1
+        parsed = _parse_cache_key(key)
+        if parsed is None:
+            return
+        base, link_type = parsed
+        for contest_id in self._contest_ids.get(base, ()):
+            flags = list(self._contest_states.get(contest_id, NOT_DOWNLOADED))
+            flags[LINK_TYPES.index(link_type)] = downloaded
+            # swap in a new tuple so readers never see a half-updated row
+            self._contest_states[contest_id] = tuple(flags)
+
+    def contest_state(self, contest_id):
+        """(pdf, zip, other) downloaded flags for a contest."""
+        return self._contest_states.get(contest_id, NOT_DOWNLOADED)
+
+    def downloaded_contests(self):
+        """{contest id: (pdf, zip, other)} for every contest with at least one downloaded file."""
+        return dict(self._contest_states)
+
+    def _record_fingerprint(self, file_count):
+        self._dir_fingerprint = self._fingerprint(file_count)
+        self._store.queue_meta('dir_fingerprint', self._dir_fingerprint)
+
+    def _adjust_fingerprint(self, file_delta):
+        """Re-record the fingerprint after changes we know of, without listing the directory."""
+        if self._dir_fingerprint:
+            count = int(self._dir_fingerprint.rsplit(':', 1)[1])
+            self._record_fingerprint(count + file_delta)
+
+    def apply_changes(self, paths):
+        """Apply a batch of created/modified/deleted/renamed paths reported by the watcher."""
+        changed = 0
+        file_delta = 0  # files that came minus files that went
+        with self._cache_lock:
+            for path in map(Path, paths):
+                if path.parent != self.downloads_dir or path.name in CacheIndexStore.RESERVED_NAMES:
+                    continue
+                key = path.stem
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    st = None
+                if st is None or not stat.S_ISREG(st.st_mode):
+                    entry = self._cache_index.get(key)
+                    if entry and entry['path'] == str(path):
+                        self._drop_entry(key)
+                        changed += 1
+                        file_delta -= 1
+                    continue
+                info = self._entry_info(path, st)
+                known = self._cache_index.get(key)
+                if known != info:
+                    self._set_entry(key, info)
+                    changed += 1
+                    file_delta += known is None
+            if changed:
+                self._adjust_fingerprint(file_delta)
+        if changed:
+            logger.info(f"Applied {changed} external changes to the download cache")
+        return changed
+
+    def start_watching(self):
+        """Follow external changes to the downloads directory from now on."""
+        with self._cache_lock:
+            if self._watcher is not None:
+                return
+            self._watcher = DirectoryWatcher(self.downloads_dir, self.apply_changes,
+                                             lambda: self.reconcile()['paths'],
+                                             ignore=CacheIndexStore.RESERVED_NAMES)
+        self._watcher.start()
+
+    def stop_watching(self):
+        with self._cache_lock:
+            watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            watcher.stop()
+
     def is_cached(self, file_key):
         """Check if a file is already in the cache."""
         return file_key in self._cache_index
     
     def get_cached_file_path(self, file_key):
         """Get the path to a cached file."""
-        if self.is_cached(file_key):
-            return self._cache_index[file_key]['path']
-        return None
+        entry = self._cache_index.get(file_key)
+        return entry['path'] if entry else None
     
-    def add_to_cache(self, file_key, file_path):
-        """Add a file to the cache index."""
+    def add_to_cache(self, file_key, file_path, new_file=True):
+        """Add a file to the cache index. new_file is False when it replaced a file already on disk."""
         path_obj = Path(file_path)
         if path_obj.exists():
+            entry = self._entry_info(path_obj, path_obj.stat())
             with self._cache_lock:
-                self._cache_index[file_key] = {
-                    'path': str(path_obj),
-                    'size': path_obj.stat().st_size,
-                    'timestamp': datetime.fromtimestamp(path_obj.stat().st_mtime).isoformat()
-                }
-                self._save_cache_manifest()
+                self._set_entry(file_key, entry)
+                # our own download changed the directory; keep the fingerprint current so
+                # the next start doesn't treat it as an external change
+                if path_obj.parent == self.downloads_dir:
+                    self._adjust_fingerprint(1 if new_file else 0)
             logger.info(f"Added file to cache: {file_key}")
         else:
             logger.warning(f"Attempted to add non-existent file to cache: {file_path}")
     
+    def touch(self, file_key):
+        """Record that a cached file was used, for LRU eviction."""
+        if file_key in self._cache_index:
+            now = time.time()
+            self._last_access[file_key] = now
+            self._store.touch(file_key, now)
+
+    def evict(self, quota_bytes, pinned_subjects=(), pinned_years=(), keep=()):
+        """
+        Delete least-recently-used files until the cache fits in quota_bytes.
+
+        Only files the app named itself are candidates (and, once the catalog is
+        registered, only those of known contests); pinned subjects/years, the keys in
+        keep and files used in the last EVICT_GRACE_SECONDS (which may still be
+        streaming to a browser) are never evicted. Returns the evicted keys.
+        """
+        evicted = []
+        with self._cache_lock:
+            excess = self._aggregates.total_size - quota_bytes
+            if excess <= 0:
+                return evicted
+
+            candidates = []
+            recent = time.time() - EVICT_GRACE_SECONDS
+            for key, info in self._cache_index.items():
+                parsed = _parse_cache_key(key)
+                if parsed is None or key in keep:
+                    continue
+                if self._contest_ids and parsed[0] not in self._contest_ids:
+                    continue
+                fields = _split_key_base(parsed[0])
+                if fields is None:
+                    continue
+                subject, year, _ = fields
+                if subject in pinned_subjects or year in pinned_years:
+                    continue
+                if self._last_access.get(key, 0) > recent:
+                    continue
+                # never-touched files (found on disk) count as used when last modified
+                last_used = self._last_access.get(key) or datetime.fromisoformat(info['timestamp']).timestamp()
+                candidates.append((last_used, key))
+            candidates.sort()
+
+            for _, key in candidates:
+                if excess <= 0:
+                    break
+                info = self._cache_index[key]
+                try:
+                    os.remove(info['path'])
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Could not evict {info['path']}: {e}")
+                    continue
+                excess -= info['size']
+                self._drop_entry(key)
+                evicted.append(key)
+            if evicted:
+                self._record_fingerprint(len(self._scan_directory()))
+
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} least recently used files to stay within the cache quota")
+        if excess > 0:
+            logger.warning(f"Cache is {excess / 1024 / 1024:.1f} MB over quota; the remaining files are pinned or in use")
+        return evicted
+
     def get_stats(self):
-        """Get statistics about the cache."""
-        if not self._cache_index:
+        """Get statistics about the cache (kept up to date on every change, so this is O(1))."""
+        with self._cache_lock:
+            agg = self._aggregates
             return {
-                'total_files': 0,
-                'total_size': 0,
-                'newest_file': None,
-                'oldest_file': None
+                'total_files': agg.total_files,
+                'total_size': agg.total_size,
+                'newest_file': agg.newest(),
+                'oldest_file': agg.oldest(),
+                'by_subject': {name: {'files': n, 'size': size} for name, (n, size) in agg.by_subject.items()},
+                'by_type': {name: {'files': n, 'size': size} for name, (n, size) in agg.by_type.items()}
             }
-            
-        timestamps = [datetime.fromisoformat(item['timestamp']) 
-                     for item in self._cache_index.values()]
-        
-        return {
-            'total_files': len(self._cache_index),
-            'total_size': sum(item['size'] for item in self._cache_index.values()),
-            'newest_file': max(timestamps).isoformat() if timestamps else None,
-            'oldest_file': min(timestamps).isoformat() if timestamps else None
-        }
+
+    def persistence_stats(self):
+        """Get flush counters of the index store."""
+        return self._store.stats()
+
+    def close(self):
+        """Stop watching, write out pending index changes and release the store."""
+        self.stop_watching()
+        self._store.close()
+
+def _cache_quota():
+    """
+    Optional size cap from config.cfg: (quota in bytes or None, pinned subjects, pinned years).
+
+        "cache_quota_mb": 2048,
+        "cache_pinned_subjects": ["Computer Science"],
+        "cache_pinned_years": [2024]
+    """
+    try:
+        quota_mb = float(config_data.get('cache_quota_mb') or 0)
+    except (TypeError, ValueError):
+        logger.warning(f"Ignoring invalid cache_quota_mb: {config_data.get('cache_quota_mb')!r}")
+        quota_mb = 0
+    pinned_subjects = {str(s).replace(' ', '-') for s in config_data.get('cache_pinned_subjects') or []}
+    pinned_years = {str(y) for y in config_data.get('cache_pinned_years') or []}
+    return (int(quota_mb * 1024 * 1024) if quota_mb > 0 else None), pinned_subjects, pinned_years
+
+def _enforce_cache_quota(cache=None, keep=()):
+    """Run an eviction pass if a quota is configured. Returns the evicted keys."""
+    quota_bytes, pinned_subjects, pinned_years = _cache_quota()
+    if quota_bytes is None:
+        return []
+    # files still being downloaded aren't in the index yet, but their keys may be (a re-download)
+    with active_downloads_lock:
+        keep = set(keep) | active_downloads
+    try:
+        return (cache or download_cache).evict(quota_bytes, pinned_subjects, pinned_years, keep=keep)
+    except Exception as e:
+        # housekeeping: never let it fail startup or a download that already succeeded
+        logger.error(f"Error enforcing cache quota: {e}", exc_info=True)
+        return []
+
+# one cache per download directory, kept open after switching away so that switching
+# back is instant and downloads that started there can finish into it
+_caches: dict[str, DownloadCache] = {}
+_caches_lock = threading.Lock()
+
+def _get_cache(downloads_dir, defer_scan=False):
+    """Return the cache for a directory, opening it on first use."""
+    with _caches_lock:
+        cache = _caches.get(str(downloads_dir))
+        if cache is None:
+            cache = DownloadCache(downloads_dir, defer_scan=defer_scan)
+            _caches[str(downloads_dir)] = cache
+        return cache
+
+def _settle_active_cache(cache):
+    """Background part of a directory switch: check the index against the disk, then watch it."""
+    try:
+        cache.settle()
+        with _caches_lock:
+            # the user may have switched away again in the meantime
+            if cache is download_cache:
+                cache.start_watching()
+        _enforce_cache_quota(cache)
+    except Exception as e:
+        logger.error(f"Error indexing {cache.downloads_dir}: {e}", exc_info=True)
+
+def _switch_download_dir(path_obj):
+    """
+    Make path_obj the download directory. The cache's index is loaded from disk and
+    checked in the background. Readers take download_cache once and use its
+    downloads_dir, so swapping that one reference switches everyone at once.
+    """
+    global DOWNLOADS_DIR, download_cache
+    cache = _get_cache(path_obj, defer_scan=True)
+    with _caches_lock:
+        old_cache = download_cache
+        if cache is old_cache:
+            return cache
+        download_cache = cache
+        DOWNLOADS_DIR = cache.downloads_dir
+    old_cache.stop_watching()
+    threading.Thread(target=_settle_active_cache, args=(cache,), name="uildl-cache-settle", daemon=True).start()
+    return cache
 
 # Initialize the download cache
-download_cache = DownloadCache()
+download_cache = _get_cache(DOWNLOADS_DIR)
+download_cache.start_watching()
+_enforce_cache_quota()
+
+@atexit.register
+def _close_download_cache():
+    """Flush queued cache index writes on shutdown."""
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        try:
+            cache.close()
+        except Exception as e:
+            logger.error(f"Error closing download cache for {cache.downloads_dir}: {e}")
 
 def format_filename(subject, level, year, link_type, extension):
     """Format filename: subject_year_level_linktype.extension"""
-    base_name = f"{subject.replace(' ', '-')}_{year}_{level.replace(' ', '-')}"
+    base_name = _cache_key_base(subject, level, year)
     # Use link_type to differentiate files for the same contest
     return f"{base_name}_{link_type}{extension}"
 
 def generate_cache_key(subject, level, year, link_type):
     """Generate a consistent cache key for a contest's file."""
-    base_key = f"{subject.replace(' ', '-')}_{year}_{level.replace(' ', '-')}"
-    return f"{base_key}_{link_type}"
+    return f"{_cache_key_base(subject, level, year)}_{link_type}"
+
+# bumped whenever the contests table is rebuilt, so the cache re-registers the catalog
+catalog_version = 0
+
+def _contest_states():
+    """The download cache, with the current catalog registered for contest_state() lookups."""
+    cache = download_cache
+    if cache.catalog_version != catalog_version:
+        version = catalog_version
+        rows = db.session.query(Contest.id, Contest.subject, Contest.level, Contest.year).all()
+        cache.register_contests(rows, version)
+    return cache
+
+def _catalog_engine():
+    """'memory' (default) serves the table endpoints from CatalogIndex; "catalog_engine": "sql" queries info.db."""
+    engine = str(config_data.get('catalog_engine') or 'memory').lower()
+    return engine if engine in ('memory', 'sql') else 'memory'
+
+_catalog_index = (None, None)  # (catalog_version, CatalogIndex)
+_catalog_index_lock = threading.Lock()
+
+def _catalog():
+    """The in-memory catalog, reloaded from info.db when catalog_version moves."""
+    global _catalog_index
+    version, index = _catalog_index
+    if index is None or version != catalog_version:
+        with _catalog_index_lock:
+            version, index = _catalog_index
+            if index is None or version != catalog_version:
+                version = catalog_version
+                started = time.perf_counter()
+                index = CatalogIndex.from_rows(db.session.query(
+                    Contest.id, Contest.subject, Contest.level, Contest.year, Contest.level_sort,
+                    Contest.pdf_link, Contest.zip_link, Contest.other_link
+                ).all())
+                _catalog_index = (version, index)
+                logger.info(f"Catalog loaded into memory: {len(index)} contests in "
+                            f"{(time.perf_counter() - started) * 1000:.1f} ms")
+    return index
+
+def _search(q):
+    """(ranked contest ids, corrected query or None) for a search box query."""
+    catalog = _catalog()
+    return search_ids(db.session, q, vocabulary=catalog.values['subject'] + catalog.values['level'],
+                      metadata=catalogdb.metadata())
+
+CONTESTS_PAGE_SIZE = 100  # rows per /contests page; further pages load as the table scrolls
+
+def _parse_years(values):
+    """The years among values as ints; anything that isn't a year is ignored."""
+    years = []
+    for value in values:
+        try:
+            years.append(int(value))
+        except (TypeError, ValueError):
+            logger.debug(f"Ignoring year filter value {value!r}")
+    return years
+
+def _read_contest_filters(values=None, sort_by=None, sort_dir='asc'):
+    """
+    Table filters from request parameters (or a MultiDict). The filter form posts
+    subjects/levels/years while links and the API use subject/level/year; both work.
+    """
+    values = request.values if values is None else values
+    return {
+        'subjects': values.getlist('subject') + values.getlist('subjects'),
+        'levels': values.getlist('level') + values.getlist('levels'),
+        'years': _parse_years(values.getlist('year') + values.getlist('years')),
+        'downloaded': values.get('downloaded', ''),
+        'q': values.get('q', '').strip(),
+        'sort_by': values.get('sort_by', sort_by),
+        'sort_dir': values.get('sort_dir', sort_dir),
+    }
+
+def _filter_params(filters):
+    """Query string arguments that reproduce filters (for links such as the next page)."""
+    return {
+        'subject': filters['subjects'],
+        'level': filters['levels'],
+        'year': filters['years'],
+        'downloaded': filters['downloaded'] or None,
+        'q': filters['q'] or None,
+        'sort_by': filters['sort_by'],
+        'sort_dir': filters['sort_dir'],
+    }
+
+def _sql_order(sort_by, sort_dir):
+    """(column, descending) pairs for a table sort; mirrors catalog.SORT_COLUMNS."""
+    level_sort = func.coalesce(Contest.level_sort, -1)
+    descending = sort_dir == 'desc'
+    if sort_by == 'subject':
+        columns = [(Contest.subject, descending)]
+    elif sort_by == 'level':
+        columns = [(level_sort, descending), (Contest.level, descending)]
+    elif sort_by == 'year':
+        columns = [(Contest.year, descending)]
+    elif sort_by == 'status':
+        columns = [(status_rank(Contest), descending)]
+    else:
+        columns = [(Contest.subject, False), (level_sort, False), (Contest.level, False), (Contest.year, True)]
+    return columns + [(Contest.id, descending)]
+
+def _keyset_after(columns, values):
+    """WHERE clause for the rows that come after values in ORDER BY columns."""
+    clauses = []
+    for i, (column, descending) in enumerate(columns):
+        past = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*[c == v for (c, _), v in zip(columns[:i], values)], past))
+    return or_(*clauses)
+
+def _select_contests(subjects=(), levels=(), years=(), sort_by=None, sort_dir='asc', ids=None,
+                     downloaded='', complete=None, after=None, limit=None):
+    """
+    Filtered, sorted contests (Contest rows or CatalogIndex records, same attributes).
+    downloaded is the table's status filter, complete the API's (every link downloaded,
+    or not); after/limit page through the result by keyset (after = sort_values() of
+    the previous page's last row).
+    """
+    sort_by, sort_dir = normalize_sort(sort_by, sort_dir)
+    if _catalog_engine() == 'memory':
+        catalog = _catalog()
+        restrict = _status_filter_mask(catalog, downloaded)
+        if complete is not None:
+            complete_rows = _contest_status_bitsets(catalog)['complete']
+            restrict &= complete_rows if complete else catalog.all_rows & ~complete_rows
+        bitsets = _contest_status_bitsets(catalog) if sort_by == 'status' else None
+        return catalog.query(subjects, levels, years, sort_by, sort_dir, ids=ids, restrict=restrict,
+                             after=after, limit=limit, status_bitsets=bitsets)
+
+    query = db.session.query(Contest)
+    if downloaded in ('true', 'false', 'partial') or complete is not None or sort_by == 'status':
+        _sync_download_state()
+        on = download_state.c.contest_id == Contest.id
+        query = query.join(download_state, on) if needs_inner_join(downloaded) else query.outerjoin(download_state, on)
+        if status_clause(downloaded) is not None:
+            query = query.filter(status_clause(downloaded))
+        if complete is not None:
+            query = query.filter(complete_clause(Contest, complete))
+    if ids is not None:
+        query = query.filter(Contest.id.in_(ids))
+    if subjects:
+        query = query.filter(Contest.subject.in_(subjects))
+    if levels:
+        query = query.filter(Contest.level.in_(levels))
+    if years:
+        query = query.filter(Contest.year.in_(years))
+    columns = _sql_order(sort_by, sort_dir)
+    query = query.order_by(*[column.desc() if descending else column.asc() for column, descending in columns])
+    if after is not None:
+        query = query.filter(_keyset_after(columns, after))
+    return query.limit(limit).all() if limit else query.all()
+
+def _sync_download_state():
+    """Bring the SQL mirror of the download cache up to date (a no-op unless something changed)."""
+    cache = _contest_states()
+    key = (cache.catalog_version, str(cache.downloads_dir), cache.generation)
+    download_state_mirror.sync(key, cache.downloaded_contests(), _contest_links)
+
+def _contest_links(ids, chunk=500):
+    """{contest id: (pdf_link, zip_link, other_link)} for ids, by primary key."""
+    links = {}
+    for start in range(0, len(ids), chunk):
+        rows = db.session.query(Contest.id, Contest.pdf_link, Contest.zip_link, Contest.other_link) \
+            .filter(Contest.id.in_(ids[start:start + chunk])).all()
+        links.update((contest_id, tuple(row)) for contest_id, *row in rows)
+    return links
+
+if _catalog_engine() == 'memory':
+    with app.app_context():
+        _catalog()
+
+# ----- conditional requests -----
+# catalog and download generations restart with the process, so tags carry a boot id too
+_etag_boot_id = os.urandom(8).hex()
+
+def _catalog_identity():
+    """metadata version and source hash of the live catalog."""
+    meta = catalogdb.metadata()
+    return (meta.get('version'), meta.get('source_sha256'))
+
+def _etag(*parts):
+    """Strong ETag for the current request given everything its response depends on besides the catalog."""
+    cache = _contest_states()
+    state = (_etag_boot_id, _catalog_identity(), cache.catalog_version, str(cache.downloads_dir),
+             cache.generation, request.path, parts)
+    return hashlib.sha1(repr(state).encode()).hexdigest()
+
+def _not_modified(etag):
+    """A 304 if the client already holds etag (in any encoding), else None."""
+    tags = [etag] + [variant_tag(etag, encoding) for encoding in encodings()]
+    if any(request.if_none_match.contains(tag) for tag in tags):
+        return _tagged(make_response('', 304), etag)
+    return None
+
+def _tagged(response, etag):
+    response = make_response(response)
+    response.set_etag(etag)
+    # always revalidate; the 304 makes that cheap
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# rendered /contests fragments, keyed by filters and invalidated with the catalog and downloads
+contests_fragments = FragmentCache()
+
+_status_bitsets = (None, None)  # ((CatalogIndex, DownloadCache, generation), {status: bitset})
+
+def _contest_status_bitsets(index):
+    """Rows of the in-memory catalog by table status, recomputed when downloads change."""
+    global _status_bitsets
+    cache = _contest_states()
+    key = (index, cache, cache.generation)
+    cached_key, bitsets = _status_bitsets
+    if cached_key != key:
+        bitsets = index.status_bitsets(cache.contest_state)
+        _status_bitsets = (key, bitsets)
+    return bitsets
+
+def _status_filter_mask(index, downloaded_filter):
+    """Rows passing the downloaded filter of the table ('true', 'false', 'partial' or '')."""
+    if downloaded_filter not in ('true', 'false', 'partial'):
+        return index.all_rows
+    bitsets = _contest_status_bitsets(index)
+    if downloaded_filter == 'true':
+        return bitsets['downloaded']
+    if downloaded_filter == 'false':
+        return index.all_rows & ~bitsets['downloaded']
+    return bitsets['partial']
 
 @app.route('/splash')
 def splash():
     """Render the splash screen."""
     return render_template('splash.html')
 
+_bootstrap = (None, None)  # ((catalog identity, catalog version, download dir, generation), snapshot)
+
+def _bootstrap_snapshot():
+    """What the main page starts from, rebuilt only when the catalog or the download cache changes."""
+    global _bootstrap
+    cache = _contest_states()
+    # a refresh that changes no rows keeps catalog_version but still moves info_version
+    key = (_catalog_identity(), cache.catalog_version, str(cache.downloads_dir), cache.generation)
+    cached_key, snapshot = _bootstrap
+    if cached_key != key:
+        catalog = _catalog()
+        snapshot = {
+            'subjects': catalog.values['subject'],
+            'levels': catalog.values['level'],
+            'years': catalog.values['year'],
+            'facet_counts': catalog.facet_counts(),
+            'total_contest_count': len(catalog),
+            'info_version': get_database_version(),
+            'cache_stats': cache.get_stats(),
+            'download_dir_absolute': str(cache.downloads_dir.absolute()),
+        }
+        _bootstrap = (key, snapshot)
+    return snapshot
+
+with app.app_context():
+    _bootstrap_snapshot()
+
 @app.route('/')
 def index():
     """Render the main page."""
     logger.info("Loading main page")
     try:
-        # Use SQLAlchemy to get distinct values for filters
-        subjects = [s[0] for s in db.session.query(Contest.subject).distinct().order_by(Contest.subject).all()]
-        # sort levels using level_sort if available
-        try:
-            levels = [l[0] for l in db.session.query(Contest.level).distinct().order_by(Contest.level_sort, Contest.level).all()]
-        except Exception:
-            levels = [l[0] for l in db.session.query(Contest.level).distinct().order_by(Contest.level).all()]
-        years = [y[0] for y in db.session.query(Contest.year).distinct().order_by(Contest.year.desc()).all()]
-
-        # Get cache stats and database version
-        cache_stats = download_cache.get_stats()
-        db_version = get_database_version()
-        
-        return render_template('index.html',
-                               subjects=subjects,
-                               levels=levels,
-                               years=years,
-                               cache_stats=cache_stats,
-                               download_dir_absolute=DOWNLOADS_DIR.absolute(),
-                               info_version=db_version,
-                               total_contest_count=db.session.query(Contest).count(),
+        return render_template('index.html', **_bootstrap_snapshot(),
                                analytics_enabled=analytics_enabled())
     except Exception as e:
         logger.error(f"Error in index route: {e}")
@@ -306,9 +1186,23 @@ def index():
                                info_version=db_version,
                                analytics_enabled=analytics_enabled())
 
+@app.route('/api/bootstrap')
+def get_bootstrap():
+    """The main page's initial data (filter options and counts, catalog version, cache stats)."""
+    try:
+        etag = _etag()
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+        return _tagged(jsonify(_bootstrap_snapshot()), etag)
+    except Exception as e:
+        logger.error(f"Error in bootstrap route: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/refresh-info', methods=['POST'])
 def refresh_info():
     """Refreshes the contest information from the UIL website."""
+    global catalog_version
     logger.info("Refresh info requested.")
     
     if not db_rebuild_lock.acquire(blocking=False):
@@ -318,15 +1212,23 @@ def refresh_info():
     try:
         logger.info("Starting refresh info process.")
         
+        # what the live catalog was built from, kept for a rollback
+        info_path = data_path / "info.json"
+        previous_info = info_path.read_bytes() if info_path.exists() else None
+
         # Call the update_info function
         updated, value = update_info(data_dir=data_path)
         
         if updated == UpdateResult.UPDATED:
             logger.info("Info refreshed successfully - new version downloaded.")
             # rebuild the database
-            repopulate_database(info_json_path=data_path / "info.json", db_path=app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', ''))
+            # built beside the live catalog and swapped in, so queries never see a half-written one
+            changes = catalogdb.refresh_catalog(info_path, _catalog_db_path(), previous_info=previous_info)
+            if changes['inserted'] or changes['updated'] or changes['deleted']:
+                catalog_version += 1
             _log_analytics("info_refresh", {"result": "updated", "db_rebuilt": True})
-            return "Info refreshed successfully - new version downloaded. Database rebuilt.", 200
+            return (f"Info refreshed successfully - new version downloaded. Database updated: "
+                    f"{changes['inserted']} added, {changes['updated']} changed, {changes['deleted']} removed."), 200
         elif updated == UpdateResult.NOT_UPDATED:
             logger.info("Info refresh completed - no update needed.")
             _log_analytics("info_refresh", {"result": "not_updated"})
@@ -341,6 +1243,28 @@ def refresh_info():
     finally:
         db_rebuild_lock.release()
 
+@app.route('/rollback-info', methods=['POST'])
+def rollback_info():
+    """Swaps the catalog kept by the last refresh back in."""
+    global catalog_version
+    logger.info("Catalog rollback requested.")
+
+    if not db_rebuild_lock.acquire(blocking=False):
+        logger.warning("Catalog rollback requested while a refresh is in progress.")
+        return "A refresh info process is already in progress. Please wait.", 503
+
+    try:
+        if not catalogdb.rollback_catalog(_catalog_db_path(), data_path / "info.json"):
+            return "No previous catalog to roll back to.", 404
+        catalog_version += 1
+        _log_analytics("info_rollback", {"result": "rolled_back"})
+        return "Catalog rolled back to the previous version.", 200
+    except Exception as e:
+        logger.error(f"Failed to roll back catalog: {e}", exc_info=True)
+        return f"Failed to roll back catalog: {str(e)}", 500
+    finally:
+        db_rebuild_lock.release()
+
 @app.route('/download/<int:item_id>/<link_type>', methods=['GET', 'POST'])
 def download_file(item_id, link_type):
     """Download a file for a specific contest, identified by link_type (pdf, zip, other)."""
@@ -385,6 +1309,8 @@ def download_file(item_id, link_type):
             item.year,
             link_type # use link_type in cache key
         )
+        # the rest is network i/o; don't hold a catalog connection through it
+        db.session.close()
         # analytics: record download trigger
         _log_analytics(
             "download_triggered",
@@ -462,11 +1388,12 @@ def download_file(item_id, link_type):
 def refresh_cache():
     """Refresh the download cache."""
     logger.info("Refreshing download cache")
-    count = download_cache.rebuild_cache()
-    _log_analytics("cache_refreshed", {"found_files": int(count), "cache_size": download_cache.get_stats()["total_size"]})
+    cache = download_cache
+    count = cache.rebuild_cache()
+    _log_analytics("cache_refreshed", {"found_files": int(count), "cache_size": cache.get_stats()["total_size"]})
     
     # Return HTMX-friendly response for cache info update
-    cache_stats = download_cache.get_stats()
+    cache_stats = cache.get_stats()
     return f"""
     <div class="text-sm text-gray-600 dark:text-gray-300 space-y-1">
         <p>Downloaded Files: <span>{cache_stats['total_files']}</span></p>
@@ -479,11 +1406,12 @@ def refresh_cache():
 def reset_cache():
     """Reset the download cache (forget all downloads)."""
     logger.info("Resetting download cache")
-    count = download_cache.reset_cache()
+    cache = download_cache
+    count = cache.reset_cache()
     _log_analytics("cache_reset", {"forgot_files": int(count)})
     
     # Return HTMX-friendly response for cache info update
-    cache_stats = download_cache.get_stats()
+    cache_stats = cache.get_stats()
     return f"""
     <div class="text-sm text-gray-600 dark:text-gray-300 space-y-1">
         <p>Downloaded Files: <span>{cache_stats['total_files']}</span></p>
@@ -496,117 +1424,76 @@ def reset_cache():
 def get_cache_stats():
     """Get cache statistics for the sidebar."""
     cache_stats = download_cache.get_stats()
+    quota_bytes = _cache_quota()[0]
+    quota_html = ""
+    if quota_bytes is not None:
+        headroom = max(quota_bytes - cache_stats['total_size'], 0)
+        quota_html = f"<p>Quota: <span>{headroom // 1024 // 1024} MB free of {quota_bytes // 1024 // 1024} MB</span></p>"
     return f"""
     <div class="text-sm text-gray-600 dark:text-gray-300 space-y-1">
         <p>Downloaded Files: <span>{cache_stats['total_files']}</span></p>
         <p>Total Size: <span>{cache_stats['total_size'] // 1024 // 1024} MB</span></p>
+        {quota_html}
     </div>
     """
 
 @app.route('/contests', methods=['GET', 'POST'])
 def get_contests_htmx():
-    """Get contests formatted for HTMX table body."""
+    """Get contests formatted for HTMX table body. With a cursor, just the rows of the next page."""
     try:
-        query = db.session.query(Contest)
-        
-        # Get filter parameters from either GET args or POST form data
-        if request.method == 'POST':
-            form_data = request.form
-            subjects = form_data.getlist('subjects')
-            levels = form_data.getlist('levels') 
-            years = form_data.getlist('years')
-            downloaded_filter = form_data.get('downloaded', '')
-            sort_by = form_data.get('sort_by', 'year')
-            sort_dir = form_data.get('sort_dir', 'desc')
-        else:
-            subjects = request.args.getlist('subject')
-            levels = request.args.getlist('level')
-            years = request.args.getlist('year')
-            downloaded_filter = request.args.get('downloaded', '')
-            sort_by = request.args.get('sort_by', 'year')
-            sort_dir = request.args.get('sort_dir', 'desc')
-        
-        # Apply filters
-        if subjects:
-            query = query.filter(Contest.subject.in_(subjects))
-        if levels:
-            query = query.filter(Contest.level.in_(levels))
-        if years:
-            query = query.filter(Contest.year.in_([int(y) for y in years]))
-
-        # Apply sorting
-        if sort_by == 'subject':
-            if sort_dir == 'desc':
-                query = query.order_by(Contest.subject.desc())
-            else:
-                query = query.order_by(Contest.subject.asc())
-        elif sort_by == 'level':
-            # use level_sort when present
-            if sort_dir == 'desc':
-                query = query.order_by(Contest.level_sort.desc(), Contest.level.desc())
-            else:
-                query = query.order_by(Contest.level_sort.asc(), Contest.level.asc())
-        elif sort_by == 'year':
-            if sort_dir == 'desc':
-                query = query.order_by(Contest.year.desc())
-            else:
-                query = query.order_by(Contest.year.asc())
-        else:
-            # Default sorting
-            query = query.order_by(Contest.subject, Contest.level_sort, Contest.level, Contest.year.desc())
-        
-        contests = query.all()
-        
-        # Filter by download status and build result
-        result_contests = []
-        for item in contests:
-            pdf_downloaded = download_cache.is_cached(generate_cache_key(item.subject, item.level, item.year, 'pdf')) if item.pdf_link else None
-            zip_downloaded = download_cache.is_cached(generate_cache_key(item.subject, item.level, item.year, 'zip')) if item.zip_link else None
-            other_downloaded = download_cache.is_cached(generate_cache_key(item.subject, item.level, item.year, 'other')) if item.other_link else None
-
-            # Determine status (ignore 'other' link for completeness)
-            has_pdf = item.pdf_link is not None
-            has_zip = item.zip_link is not None
-
-            # a contest is fully downloaded if its downloadable files (pdf/zip) are downloaded.
-            all_downloaded = (
-                (not has_pdf or pdf_downloaded) and
-                (not has_zip or zip_downloaded)
-            )
-
-            if not has_pdf and not has_zip:
-                status = 'no-links'
-            elif all_downloaded:
-                status = 'downloaded'
-            elif (pdf_downloaded or zip_downloaded):
-                status = 'partial'
-            else:
-                status = 'pending'
-
-            item_data = {
-                'contest': item,
-                'pdf_downloaded': pdf_downloaded,
-                'zip_downloaded': zip_downloaded,
-                'other_downloaded': other_downloaded,
-                'status': status
-            }
-
-            # Apply download filter
-            if downloaded_filter == 'true' and status != 'downloaded':
-                continue
-            elif downloaded_filter == 'false' and status == 'downloaded':
-                continue
-            elif downloaded_filter == 'partial' and status != 'partial':
-                continue
-                
-            result_contests.append(item_data)
-        
-        return render_template('contests_table.html', contests=result_contests)
-        
+        filters = _read_contest_filters(sort_by='year', sort_dir='desc')
+        cursor = request.values.get('cursor')
+        key = _fragment_key(filters, cursor)
+        etag = _etag(key)
+        if request.method == 'GET':
+            not_modified = _not_modified(etag)
+            if not_modified is not None:
+                return not_modified
+        cache = _contest_states()
+        # everything the fragment depends on besides the filters
+        version = (cache.catalog_version, str(cache.downloads_dir), cache.generation)
+        body = contests_fragments.get(version, key, lambda: _render_contests(filters, cursor, cache))
+        return _tagged(body, etag)
     except Exception as e:
         logger.error(f"Error in contests route: {e}")
         return f'<tbody><tr><td colspan="7" class="text-center text-red-600">Error loading contests: {str(e)}</td></tr></tbody>'
 
+def _fragment_key(filters, cursor):
+    """Filters in a canonical form, so equivalent requests share a cached fragment."""
+    sort_by, sort_dir = normalize_sort(filters['sort_by'], filters['sort_dir'])
+    return (tuple(sorted(set(filters['subjects']))), tuple(sorted(set(filters['levels']))),
+            tuple(sorted(set(filters['years']))), filters['downloaded'], filters['q'],
+            sort_by, sort_dir, cursor or None)
+
+def _render_contests(filters, cursor, cache):
+    after = decode_cursor(cursor) if cursor else None
+    ids, search_correction = _search(filters['q']) if filters['q'] else (None, None)
+    contests = _select_contests(filters['subjects'], filters['levels'], filters['years'],
+                                filters['sort_by'], filters['sort_dir'], ids=ids,
+                                downloaded=filters['downloaded'], after=after, limit=CONTESTS_PAGE_SIZE)
+
+    result_contests = []
+    for item in contests:
+        pdf_state, zip_state, other_state = cache.contest_state(item.id)
+        result_contests.append({
+            'contest': item,
+            'pdf_downloaded': pdf_state if item.pdf_link else None,
+            'zip_downloaded': zip_state if item.zip_link else None,
+            'other_downloaded': other_state if item.other_link else None,
+            'status': contest_status(item.pdf_link, item.zip_link, pdf_state, zip_state)
+        })
+
+    next_url = None
+    if len(contests) == CONTESTS_PAGE_SIZE:
+        sort_by, _ = normalize_sort(filters['sort_by'], filters['sort_dir'])
+        last = sort_values(contests[-1], sort_by, status=result_contests[-1]['status'])
+        next_url = url_for('get_contests_htmx', **_filter_params(filters), cursor=encode_cursor(last))
+
+    if after is not None:
+        return render_template('contests_rows.html', contests=result_contests, next_url=next_url)
+    return render_template('contests_table.html', contests=result_contests, next_url=next_url,
+                           search_correction=search_correction)
+
 @app.route('/shutdown', methods=['POST', 'GET'])
 def shutdown():
     """Shutdown the application."""
@@ -621,104 +1508,176 @@ def shutdown():
     os.kill(pid, signal.SIGINT)
     return "Server shutting down. Thank you for using, see you next time!"
 
+def _contest_json(item, cache):
+    """API representation of a contest with the downloaded state of each link."""
+    pdf_state, zip_state, other_state = cache.contest_state(item.id)
+    return {
+        'id': item.id,
+        'subject': item.subject,
+        'level': item.level,
+        'year': item.year,
+        'pdf_link': {
+            'link': item.pdf_link,
+            'downloaded': pdf_state if item.pdf_link else None
+        },
+        'zip_link': {
+            'link': item.zip_link,
+            'downloaded': zip_state if item.zip_link else None
+        },
+        'other_link': {
+            'link': item.other_link,
+            'downloaded': other_state if item.other_link else None
+        }
+    }
+
 @app.route('/api/contests')
 def get_contests():
     """API endpoint to get contest data based on filters."""
     try:
-        query = db.session.query(Contest)
-        
-        # Apply filters from query parameters
-        subjects = request.args.getlist('subject')
-        if subjects:
-            query = query.filter(Contest.subject.in_(subjects))
-        
-        levels = request.args.getlist('level')
-        if levels:
-            query = query.filter(Contest.level.in_(levels))
-        
-        years = request.args.getlist('year')
-        if years:
-            # Ensure years are integers for correct filtering
-            query = query.filter(Contest.year.in_([int(y) for y in years]))
-
-        # Order results for consistent presentation
-        query = query.order_by(Contest.subject, Contest.level_sort, Contest.level, Contest.year.desc())
-        
-        contests = query.all()
-        
-        # Filter by download status in Python after the database query
+        filters = _read_contest_filters()
         downloaded_filter = request.args.get('downloaded')
-        result_data = []
-        for item in contests:
-            item_dict = {
-                'id': item.id,
-                'subject': item.subject,
-                'level': item.level,
-                'year': item.year,
-                'pdf_link': {
-                    'link': item.pdf_link,
-                    'downloaded': download_cache.is_cached(generate_cache_key(item.subject, item.level, item.year, 'pdf')) if item.pdf_link else None
-                },
-                'zip_link': {
-                    'link': item.zip_link,
-                    'downloaded': download_cache.is_cached(generate_cache_key(item.subject, item.level, item.year, 'zip')) if item.zip_link else None
-                },
-                'other_link': {
-                    'link': item.other_link,
-                    'downloaded': download_cache.is_cached(generate_cache_key(item.subject, item.level, item.year, 'other')) if item.other_link else None
-                }
-            }
-
-            if downloaded_filter in ['true', 'false']:
-                has_pdf = item_dict['pdf_link']['link'] is not None
-                has_zip = item_dict['zip_link']['link'] is not None
-                has_other = item_dict['other_link']['link'] is not None
-                
-                # A link is considered downloaded if it doesn't exist or is cached
-                pdf_downloaded = not has_pdf or item_dict['pdf_link']['downloaded']
-                zip_downloaded = not has_zip or item_dict['zip_link']['downloaded']
-                other_downloaded = not has_other or item_dict['other_link']['downloaded']
-                
-                is_fully_downloaded = pdf_downloaded and zip_downloaded and other_downloaded
-                
-                if downloaded_filter == 'true' and is_fully_downloaded:
-                    result_data.append(item_dict)
-                elif downloaded_filter == 'false' and not is_fully_downloaded:
-                    result_data.append(item_dict)
-            else:
-                # No download filter, so add the item
-                result_data.append(item_dict)
+        etag = _etag(_fragment_key(filters, None), downloaded_filter)
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+
+        ids = _search(filters['q'])[0] if filters['q'] else None
+        # downloaded here means every link the contest has is downloaded
+        complete = {'true': True, 'false': False}.get(downloaded_filter)
+        contests = _select_contests(filters['subjects'], filters['levels'], filters['years'], ids=ids,
+                                    complete=complete)
+        cache = _contest_states()
+        result_data = [_contest_json(item, cache) for item in contests]
             
-        return jsonify(result_data)
+        return _tagged(jsonify(result_data), etag)
     except Exception as e:
         logger.error(f"Error in API route: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/facets')
+def get_facets():
+    """Match counts for every subject, level, year and status under the current filters."""
+    try:
+        catalog = _catalog()
+        filters = _read_contest_filters()
+        subjects, levels = filters['subjects'], filters['levels']
+        years = filters['years']
+        matches = catalog.rows_mask(_search(filters['q'])[0]) if filters['q'] else catalog.all_rows
+        restrict = _status_filter_mask(catalog, filters['downloaded']) & matches
+
+        counts = catalog.facet_counts(subjects, levels, years, restrict)
+        # the status select is counted under the subject/level/year selection and the search
+        selected = catalog.filter(subjects, levels, years) & matches
+        by_status = _contest_status_bitsets(catalog)
+        counts['downloaded'] = {
+            'true': (selected & by_status['downloaded']).bit_count(),
+            'partial': (selected & by_status['partial']).bit_count(),
+            'false': (selected & ~by_status['downloaded']).bit_count(),
+        }
+        counts['total'] = (selected & restrict).bit_count()
+        return jsonify(counts)
+    except Exception as e:
+        logger.error(f"Error in facets route: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/search')
+def search_contests():
+    """Ranked search over subject, level, year and file name, combinable with the table filters."""
+    try:
+        filters = _read_contest_filters()
+        q = filters['q']
+        limit = request.args.get('limit', 50, type=int)
+        ids, corrected = _search(q)
+
+        catalog = _catalog()
+        mask = catalog.filter(filters['subjects'], filters['levels'], filters['years'])
+        mask &= _status_filter_mask(catalog, filters['downloaded'])
+        matches = catalog.pick(ids, mask)
+
+        cache = _contest_states()
+        return jsonify({
+            'query': q,
+            'corrected': corrected,
+            'total': len(matches),
+            'results': [_contest_json(item, cache) for item in matches[:limit]],
+        })
+    except Exception as e:
+        logger.error(f"Error in search route: {e}")
+        return jsonify({"error": str(e)}), 500
+
+_catalog_stats_memo = (None, None)  # ((catalog identity, catalog version, download dir, generation), stats)
+
+def _catalog_stats():
+    """
+    Contest and file totals of the catalog, with available vs downloaded files per
+    subject and per year. One grouped scan of contests, redone only when the catalog
+    or the download cache changes.
+    """
+    global _catalog_stats_memo
+    cache = _contest_states()
+    key = (_catalog_identity(), cache.catalog_version, str(cache.downloads_dir), cache.generation)
+    cached_key, stats = _catalog_stats_memo
+    if cached_key == key:
+        return stats
+
+    # COUNT(column) skips NULLs, so each one counts the contests that have that link
+    rows = db.session.query(Contest.subject, Contest.year, func.count(Contest.id),
+                            func.count(Contest.pdf_link), func.count(Contest.zip_link),
+                            func.count(Contest.other_link)) \
+        .group_by(Contest.subject, Contest.year).all()
+    by_subject, by_year = {}, {}
+    total_contests = total_files = 0
+    for subject, year, contests, pdfs, zips, others in rows:
+        total_contests += contests
+        total_files += pdfs + zips + others
+        for bucket in (by_subject.setdefault(subject, {'available': 0, 'downloaded': 0}),
+                       by_year.setdefault(year, {'available': 0, 'downloaded': 0})):
+            bucket['available'] += pdfs + zips + others
+
+    catalog = _catalog()
+    for contest_id, flags in cache.downloaded_contests().items():
+        row = catalog.row_of.get(contest_id)
+        if row is None:
+            continue
+        record = catalog.records[row]
+        links = (record.pdf_link, record.zip_link, record.other_link)
+        downloaded = sum(1 for link, flag in zip(links, flags) if link is not None and flag)
+        by_subject[record.subject]['downloaded'] += downloaded
+        by_year[record.year]['downloaded'] += downloaded
+
+    stats = {
+        "total_contests": total_contests,
+        "total_files_available": total_files,
+        "by_subject": by_subject,
+        "by_year": by_year,
+    }
+    _catalog_stats_memo = (key, stats)
+    return stats
+
 @app.route('/api/stats')
 def get_stats():
     """Get download cache statistics."""
     try:
-        total_contests_query = db.session.query(func.count(Contest.id))
-        
-        # Count total available files by checking for non-null links
-        total_files = total_contests_query.filter(Contest.pdf_link.isnot(None)).scalar() + \
-                      total_contests_query.filter(Contest.zip_link.isnot(None)).scalar() + \
-                      total_contests_query.filter(Contest.other_link.isnot(None)).scalar()
-
-        total_contests = total_contests_query.scalar()
-        
         cache_stats = download_cache.get_stats()
-        
+        quota_bytes = _cache_quota()[0]
+        etag = _etag(cache_stats['total_files'], cache_stats['total_size'], quota_bytes)
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+
+        catalog_stats = _catalog_stats()
+        total_files = catalog_stats['total_files_available']
         stats = {
-            "total_contests": total_contests,
-            "total_files_available": total_files,
+            **catalog_stats,
             "downloaded_files": cache_stats['total_files'],
             "download_size_bytes": cache_stats['total_size'],
             "download_percentage": (cache_stats['total_files'] / total_files) * 100 if total_files > 0 else 0,
+            "quota_bytes": quota_bytes,
+            "quota_headroom_bytes": max(quota_bytes - cache_stats['total_size'], 0) if quota_bytes is not None else None,
             "database_version": get_database_version()
         }
         
-        return jsonify(stats)
+        return _tagged(jsonify(stats), etag)
     except Exception as e:
         logger.error(f"Error in stats route: {e}")
         return jsonify({"error": str(e)}), 500
@@ -733,6 +1692,20 @@ def get_version():
         logger.error(f"Error in version route: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/metrics')
+def get_metrics():
+    """Get internal performance counters."""
+    try:
+        return jsonify({
+            "cache_index": download_cache.persistence_stats(),
+            "contests_fragments": contests_fragments.stats(),
+            "compression": compressor.stats(),
+            "download_state": download_state_mirror.stats()
+        })
+    except Exception as e:
+        logger.error(f"Error in metrics route: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/active-downloads')
 def get_active_downloads():
     """Get the count of currently active downloads."""
@@ -752,8 +1725,12 @@ def get_active_downloads():
 
 # Helper function to perform an individual download (shared by single and batch routes)
 
-def _perform_download(contest_item, link_type):
+def _perform_download(contest_item, link_type, cache=None):
     """Download a specific file for a contest item and add it to cache. Returns dict result."""
+    # contest_item's columns are loaded; give the connection back before the network i/o
+    db.session.close()
+    # stick with the directory we started in, even if the user switches mid-download
+    cache = cache or download_cache
     link_map = {
         'pdf': contest_item.pdf_link,
         'zip': contest_item.zip_link,
@@ -765,23 +1742,26 @@ def _perform_download(contest_item, link_type):
         return {"item_id": contest_item.id, "link_type": link_type, "downloaded": False, "reason": "No link available"}
 
     cache_key = generate_cache_key(contest_item.subject, contest_item.level, contest_item.year, link_type)
+    if not cache.indexed:
+        # a directory indexed for the first time: until that's done a miss may be a file we already have
+        cache.ready.wait(CACHE_READY_TIMEOUT)
     # ensure only one thread handles a given file at a time
     download_lock = _get_download_lock(cache_key)
     with download_lock:
-        cached_path = download_cache.get_cached_file_path(cache_key)
+        cached_path = cache.get_cached_file_path(cache_key)
         if cached_path:
+            cache.touch(cache_key)
             return {"item_id": contest_item.id, "link_type": link_type, "downloaded": True, "cached": True, "file_path": cached_path}
 
-        import requests, os
-        
         # Add to active downloads tracking
         with active_downloads_lock:
             active_downloads.add(cache_key)
         
+        response = None
         try:
             with download_semaphore:
-                response = requests.get(url_to_download, timeout=30, stream=True, verify=False)
-                response.raise_for_status()
+                response = get_transport().get(url_to_download, timeout=30)
+            expected_size = _remember_remote_size(url_to_download, response.headers)
 
             # Determine extension
             file_extension = os.path.splitext(url_to_download)[1] or '.dat'
@@ -789,15 +1769,22 @@ def _perform_download(contest_item, link_type):
                 file_extension = '.' + file_extension
 
             formatted_filename = format_filename(contest_item.subject, contest_item.level, contest_item.year, link_type, file_extension)
-            file_path = DOWNLOADS_DIR / formatted_filename
+            file_path = cache.downloads_dir / formatted_filename
             tmp_file_path = TEMP_DIR / formatted_filename
 
             # atomic streaming write to a temporary file, then move it
             try:
+                started = time.monotonic()
                 with open(tmp_file_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
+                    _preallocate(f, expected_size)
+                    for chunk in response.iter_bytes(8192):
                         if chunk:
                             f.write(chunk)
+                    # drop any preallocated tail if the server sent less than announced
+                    f.truncate()
+                    written = f.tell()
+                _record_throughput(written, time.monotonic() - started)
+                replaced = file_path.exists()
                 shutil.move(str(tmp_file_path), str(file_path))
             except Exception:
                 # if something goes wrong, try to clean up the temporary file
@@ -805,12 +1792,16 @@ def _perform_download(contest_item, link_type):
                     tmp_file_path.unlink()
                 raise # re-raise the exception to be caught by the outer handler
 
-            download_cache.add_to_cache(cache_key, str(file_path))
+            cache.add_to_cache(cache_key, str(file_path), new_file=not replaced)
+            cache.touch(cache_key)
+            _enforce_cache_quota(cache, keep={cache_key})
             return {"item_id": contest_item.id, "link_type": link_type, "downloaded": True, "cached": False, "file_path": str(file_path)}
         except Exception as e:
             logger.error(f"Download error for item {contest_item.id} ({link_type}): {e}")
             return {"item_id": contest_item.id, "link_type": link_type, "downloaded": False, "reason": str(e)}
         finally:
+            if response is not None:
+                response.close()
             # Remove from active downloads tracking
             with active_downloads_lock:
                 active_downloads.discard(cache_key)
@@ -828,22 +1819,34 @@ def batch_download():
     logger.info("Batch download request received")
     try:
         data = request.get_json(silent=True) or {}
-        items = data.get('items', [])
+        items = _batch_items(data)
         if not items:
             return jsonify({"error": "No items provided"}), 400
 
+        resolved = _resolve_batch_items(items)
+        jobs = [job for job in resolved if isinstance(job, tuple)]
+        # the contests are loaded; give the connection back before the probes and downloads
+        db.session.close()
+        # the whole batch goes to the directory that was current when it started
+        cache = download_cache
+
+        # refuse up front if the known sizes don't fit on disk
+        plan = _build_batch_plan(jobs, cache, probe=False)
+        logger.info(f"Batch plan: {plan}")
+        if not plan['fits']:
+            logger.warning("Batch download refused: not enough free space")
+            return jsonify({
+                "success": False,
+                "error": "Not enough free space in the download directory for this batch.",
+                "plan": plan
+            }), 507
+
         results = []
-        for entry in items:
-            item_id = entry.get('id')
-            link_type = entry.get('type')
-            if link_type not in ['pdf', 'zip']:
-                # Skip unsupported types (other is just a link)
-                results.append({"item_id": item_id, "link_type": link_type, "downloaded": False, "reason": "Unsupported type"})
-                continue
-            contest_item = db.session.get(Contest, int(item_id))
-            if not contest_item:
-                results.append({"item_id": item_id, "link_type": link_type, "downloaded": False, "reason": "Contest not found"})
+        for job in resolved:
+            if not isinstance(job, tuple):
+                results.append(job)
                 continue
+            contest_item, link_type = job
             # analytics: record download trigger (batch)
             _log_analytics(
                 "download_triggered",
@@ -854,20 +1857,88 @@ def batch_download():
                     "link_type": link_type,
                 }
             )
-            results.append(_perform_download(contest_item, link_type))
+            results.append(_perform_download(contest_item, link_type, cache))
 
         # After downloads, return summary and updated cache stats
-        cache_stats = download_cache.get_stats()
-        return jsonify({"success": True, "results": results, "cache_stats": cache_stats})
+        cache_stats = cache.get_stats()
+        return jsonify({"success": True, "results": results, "cache_stats": cache_stats, "plan": plan})
     except Exception as e:
         logger.error(f"Error in batch download route: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+def _filter_batch_items(filter_values, exclude=()):
+    """
+    Batch entries ({id, type}) for every pdf/zip not downloaded yet among the contests
+    matching a table filter, minus the excluded entries. This is what "select all"
+    means once the table is paged: the whole filter, not just the rows loaded so far.
+    """
+    values = MultiDict([
+        (name, value)
+        for name, given in (filter_values or {}).items()
+        for value in (given if isinstance(given, list) else [given])
+    ])
+    filters = _read_contest_filters(values)
+    ids = _search(filters['q'])[0] if filters['q'] else None
+    contests = _select_contests(filters['subjects'], filters['levels'], filters['years'],
+                                ids=ids, downloaded=filters['downloaded'])
+    excluded = {(str(entry.get('id')), entry.get('type')) for entry in exclude}
+    cache = _contest_states()
+    items = []
+    for item in contests:
+        pdf_state, zip_state, _ = cache.contest_state(item.id)
+        for link_type, link, state in (('pdf', item.pdf_link, pdf_state), ('zip', item.zip_link, zip_state)):
+            if link and not state and (str(item.id), link_type) not in excluded:
+                items.append({'id': item.id, 'type': link_type})
+    return items
+
+def _batch_items(data):
+    """Items of a batch request: an explicit list, or a table filter (plus exclusions)."""
+    if data.get('filter') is not None:
+        return _filter_batch_items(data['filter'], data.get('exclude') or [])
+    return data.get('items', [])
+
+def _resolve_batch_items(items):
+    """
+    Turn batch entries ({id, type}) into (contest_item, link_type) jobs.
+    Entries that can't be downloaded are returned as failed result dicts in their place.
+    """
+    resolved = []
+    for entry in items:
+        item_id = entry.get('id')
+        link_type = entry.get('type')
+        if link_type not in ['pdf', 'zip']:
+            # Skip unsupported types (other is just a link)
+            resolved.append({"item_id": item_id, "link_type": link_type, "downloaded": False, "reason": "Unsupported type"})
+            continue
+        contest_item = db.session.get(Contest, int(item_id))
+        if not contest_item:
+            resolved.append({"item_id": item_id, "link_type": link_type, "downloaded": False, "reason": "Contest not found"})
+            continue
+        resolved.append((contest_item, link_type))
+    return resolved
+
+
+@app.route('/api/batch-plan', methods=['POST'])
+def batch_plan():
+    """Preview the size, free space and ETA of a batch download without starting it."""
+    try:
+        data = request.get_json(silent=True) or {}
+        items = _batch_items(data)
+        if not items:
+            return jsonify({"error": "No items provided"}), 400
+
+        jobs = [job for job in _resolve_batch_items(items) if isinstance(job, tuple)]
+        return jsonify(_build_batch_plan(jobs))
+    except Exception as e:
+        logger.error(f"Error in batch plan route: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/set-path')
 def set_path_page():
     """Render the path setting page."""
-    return render_template('set_path.html', current_path=str(DOWNLOADS_DIR.absolute()))
+    return render_template('set_path.html', current_path=str(download_cache.downloads_dir.absolute()))
 
 @app.route('/api/validate-path', methods=['POST'])
 def validate_path():
@@ -937,7 +2008,7 @@ def validate_path():
 @app.route('/api/set-path', methods=['POST'])
 def set_download_path():
     """Validate and set the download directory path."""
-    global DOWNLOADS_DIR, download_cache, config_data
+    global config_data
     
     try:
         data = request.get_json()
@@ -977,7 +2048,7 @@ def set_download_path():
             return jsonify({"success": False, "error": "Directory is not writable"})
         
         # save to config
-        old_dir = str(DOWNLOADS_DIR.absolute())
+        old_dir = str(download_cache.downloads_dir.absolute())
         config_data['download_dir'] = str(path_obj)
         
         try:
@@ -986,22 +2057,20 @@ def set_download_path():
         except Exception as e:
             return jsonify({"success": False, "error": f"Cannot save configuration: {str(e)}"})
         
-        # update global variables
-        DOWNLOADS_DIR = path_obj
-        
-        # reinitialize download cache for new directory
-        download_cache = DownloadCache(DOWNLOADS_DIR)
+        # switch to the new directory's cache; its index is checked against the disk in the background
+        cache = _switch_download_dir(path_obj)
         
-        logger.info(f"Download directory changed from {old_dir} to {DOWNLOADS_DIR}")
+        logger.info(f"Download directory changed from {old_dir} to {cache.downloads_dir}")
         # analytics: record path change without sending actual path
-        if old_dir != str(DOWNLOADS_DIR.absolute()):
+        if old_dir != str(cache.downloads_dir.absolute()):
             _log_analytics("path_changed", {"changed": True})
         
         return jsonify({
             "success": True,
             "message": f"Download path set to {path_obj}",
             "absolute_path": str(path_obj),
-            "cache_files": len(download_cache._cache_index)
+            "cache_files": len(cache._cache_index),
+            "indexing": not cache.ready.is_set()
         })
         
     except Exception as e:
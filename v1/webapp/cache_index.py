@@ -0,0 +1,320 @@
+# persistent index of downloaded files, stored next to the downloads
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from setup.mylogging import LOGGER as logger
+
+FLUSH_INTERVAL = 0.5     # seconds a queued change may wait to be batched with others
+FLUSH_BATCH_SIZE = 100   # flush straight away once this many changes are queued
+
+
+def _create_schema(conn: sqlite3.Connection):
+    conn.execute('''CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        timestamp TEXT NOT NULL,
+        last_access REAL
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )''')
+    # indexes created before last-access tracking
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(entries)')}
+    if 'last_access' not in columns:
+        conn.execute('ALTER TABLE entries ADD COLUMN last_access REAL')
+
+
+def fsync_dir(dir_path: Path):
+    """Make a rename durable (POSIX only; Windows has no directory handles)."""
+    if os.name != 'posix':
+        return
+    fd = os.open(dir_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class CacheIndexStore:
+    """
+    SQLite-backed store for the download cache index.
+
+    One row per cached file, so adding or removing a file is a single
+    indexed write instead of rewriting the whole index. Replaces the old
+    .cache_manifest.json, which is migrated (and removed) on first open.
+
+    Writes are write-behind: put() and delete() only queue the change and a
+    background flusher writes everything queued within FLUSH_INTERVAL in one
+    transaction. Call flush() to force it and close() on shutdown.
+    """
+    DB_FILE = ".cache_index.db"
+    TEMP_FILE = DB_FILE + ".tmp"
+    LEGACY_MANIFEST = ".cache_manifest.json"
+    # files in the downloads dir that belong to the index, not the cache
+    RESERVED_NAMES = {
+        DB_FILE,
+        DB_FILE + "-journal",
+        DB_FILE + "-wal",
+        DB_FILE + "-shm",
+        TEMP_FILE,
+        TEMP_FILE + "-journal",
+        LEGACY_MANIFEST,
+    }
+
+    def __init__(self, downloads_dir: Path):
+        self.downloads_dir = Path(downloads_dir)
+        self.path = self.downloads_dir / self.DB_FILE
+        self._lock = threading.Lock()  # guards the connection
+        self._conn = self._connect()
+
+        # key -> entry to write, or None to delete
+        self._pending: dict[str, dict | None] = {}
+        self._pending_meta: dict[str, str] = {}
+        self._pending_access: dict[str, float] = {}
+        self._pending_cond = threading.Condition()
+        self._closed = False
+
+        self._flush_count = 0
+        self._flushed_changes = 0
+        self._flush_seconds = 0.0
+        self._last_flush_ms = None
+        self._max_flush_ms = 0.0
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="uildl-cache-flush", daemon=True)
+        self._flusher.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        # keep the journal file around between transactions so our own writes
+        # don't keep bumping the downloads directory's mtime (see fingerprints)
+        conn.execute('PRAGMA journal_mode=TRUNCATE')
+        with conn:
+            _create_schema(conn)
+        return conn
+
+    # ----- metadata -----
+    def get_meta(self, key: str):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def queue_meta(self, key: str, value: str):
+        """Like set_meta, but written with the next flush."""
+        with self._pending_cond:
+            self._pending_meta[key] = str(value)
+            self._pending_cond.notify()
+
+    @property
+    def initialized(self) -> bool:
+        """Whether the index has ever been populated (an empty index is still valid)."""
+        return self.get_meta('initialized') == '1'
+
+    # ----- entries -----
+    def load(self) -> dict:
+        """Load every entry as {key: {'path', 'size', 'timestamp'}}."""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute('SELECT key, path, size, timestamp FROM entries').fetchall()
+        return {key: {'path': path, 'size': size, 'timestamp': ts} for key, path, size, ts in rows}
+
+    def put(self, key: str, entry: dict):
+        """Queue an insert or update of a single entry."""
+        self._queue(key, dict(entry))
+
+    def delete(self, key: str):
+        """Queue the removal of a single entry."""
+        self._queue(key, None)
+
+    def load_access(self) -> dict:
+        """Load recorded last-access times as {key: unix time}."""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute('SELECT key, last_access FROM entries WHERE last_access IS NOT NULL').fetchall()
+        return dict(rows)
+
+    def touch(self, key: str, when: float):
+        """Queue a last-access update for an entry."""
+        with self._pending_cond:
+            self._pending_access[key] = when
+            self._pending_cond.notify()
+
+    def _queue(self, key: str, entry: dict | None):
+        with self._pending_cond:
+            self._pending[key] = entry
+            self._pending_cond.notify()
+
+    def _flush_loop(self):
+        while True:
+            with self._pending_cond:
+                while not (self._pending or self._pending_meta or self._pending_access) and not self._closed:
+                    self._pending_cond.wait()
+                if self._closed:
+                    return
+                # give further changes a short window to join this batch
+                deadline = time.monotonic() + FLUSH_INTERVAL
+                while len(self._pending) < FLUSH_BATCH_SIZE and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._pending_cond.wait(remaining)
+            self.flush()
+
+    def flush(self) -> int:
+        """Write every queued change in one transaction. Returns the number written."""
+        with self._lock:
+            with self._pending_cond:
+                batch, self._pending = self._pending, {}
+                meta, self._pending_meta = self._pending_meta, {}
+                access, self._pending_access = self._pending_access, {}
+            if not (batch or meta or access) or self._conn is None:
+                return 0
+
+            started = time.monotonic()
+            try:
+                with self._conn:
+                    # upsert rather than replace, so a known file keeps its last access time
+                    self._conn.executemany(
+                        '''INSERT INTO entries (key, path, size, timestamp) VALUES (?, ?, ?, ?)
+                           ON CONFLICT(key) DO UPDATE SET
+                               path = excluded.path, size = excluded.size, timestamp = excluded.timestamp''',
+                        [(k, v['path'], v['size'], v['timestamp']) for k, v in batch.items() if v is not None]
+                    )
+                    self._conn.executemany(
+                        'DELETE FROM entries WHERE key = ?',
+                        [(k,) for k, v in batch.items() if v is None]
+                    )
+                    self._conn.executemany('UPDATE entries SET last_access = ? WHERE key = ?',
+                                           [(when, k) for k, when in access.items()])
+                    self._conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', meta.items())
+            except sqlite3.Error as e:
+                logger.error(f"Error saving {len(batch)} cache index changes: {e}")
+                # keep them queued for the next flush unless newer changes replaced them
+                with self._pending_cond:
+                    for key, entry in batch.items():
+                        self._pending.setdefault(key, entry)
+                    for key, value in meta.items():
+                        self._pending_meta.setdefault(key, value)
+                    for key, when in access.items():
+                        self._pending_access.setdefault(key, when)
+                return 0
+
+            elapsed = time.monotonic() - started
+            self._flush_count += 1
+            self._flushed_changes += len(batch) + len(meta) + len(access)
+            self._flush_seconds += elapsed
+            self._last_flush_ms = elapsed * 1000
+            self._max_flush_ms = max(self._max_flush_ms, self._last_flush_ms)
+        changes = len(batch) + len(meta) + len(access)
+        logger.info(f"Cache index flushed {changes} changes in {elapsed * 1000:.1f} ms")
+        return changes
+
+    def replace_all(self, entries: dict):
+        """
+        Replace the whole index (used by rebuild and reset). A fresh database is
+        written to a temp file, fsynced and renamed over the old one, so a crash
+        leaves either the old or the new index, never a mix.
+        """
+        tmp_path = self.downloads_dir / self.TEMP_FILE
+        with self._lock:
+            # anything still queued is already part of the snapshot
+            with self._pending_cond:
+                self._pending.clear()
+                self._pending_access.clear()
+                pending_meta, self._pending_meta = self._pending_meta, {}
+            try:
+                meta = dict(self._conn.execute('SELECT key, value FROM meta').fetchall())
+                meta.update(pending_meta)
+                meta['initialized'] = '1'
+
+                if tmp_path.exists():
+                    tmp_path.unlink()
+                tmp_conn = sqlite3.connect(tmp_path)
+                try:
+                    with tmp_conn:
+                        _create_schema(tmp_conn)
+                        tmp_conn.executemany(
+                            'INSERT INTO entries (key, path, size, timestamp) VALUES (?, ?, ?, ?)',
+                            [(k, v['path'], v['size'], v['timestamp']) for k, v in entries.items()]
+                        )
+                        tmp_conn.executemany('INSERT INTO meta (key, value) VALUES (?, ?)', meta.items())
+                finally:
+                    tmp_conn.close()
+                with open(tmp_path, 'rb+') as f:
+                    os.fsync(f.fileno())
+
+                # the old connection has to go before the file can be replaced (Windows)
+                self._conn.close()
+                try:
+                    os.replace(tmp_path, self.path)
+                    fsync_dir(self.downloads_dir)
+                finally:
+                    self._conn = self._connect()
+                logger.info(f"Cache index saved with {len(entries)} entries")
+            except (sqlite3.Error, OSError) as e:
+                logger.error(f"Error saving cache index: {e}")
+
+    def stats(self) -> dict:
+        """Flush counters for the metrics endpoint."""
+        with self._pending_cond:
+            pending = len(self._pending) + len(self._pending_meta) + len(self._pending_access)
+        return {
+            'flush_count': self._flush_count,
+            'flushed_changes': self._flushed_changes,
+            'pending_changes': pending,
+            'last_flush_ms': round(self._last_flush_ms, 3) if self._last_flush_ms is not None else None,
+            'avg_flush_ms': round(self._flush_seconds * 1000 / self._flush_count, 3) if self._flush_count else None,
+            'max_flush_ms': round(self._max_flush_ms, 3),
+        }
+
+    def migrate_legacy_manifest(self) -> int | None:
+        """
+        Import an old .cache_manifest.json into the store and remove it.
+        Returns the number of migrated entries, or None if there was nothing to migrate.
+        """
+        manifest_path = self.downloads_dir / self.LEGACY_MANIFEST
+        if not manifest_path.exists():
+            return None
+
+        try:
+            with open(manifest_path, 'r') as f:
+                legacy = json.load(f)
+            entries = {
+                key: {'path': info['path'], 'size': int(info['size']), 'timestamp': info['timestamp']}
+                for key, info in legacy.items()
+            }
+        except (json.JSONDecodeError, IOError, KeyError, TypeError, ValueError, AttributeError) as e:
+            logger.error(f"Could not migrate legacy cache manifest: {e}. It will be rebuilt from disk.")
+            entries = None
+
+        if entries is not None:
+            self.replace_all(entries)
+        try:
+            manifest_path.unlink()
+        except OSError as e:
+            logger.warning(f"Could not remove legacy cache manifest: {e}")
+        if entries is not None:
+            logger.info(f"Migrated {len(entries)} entries from {self.LEGACY_MANIFEST}")
+            return len(entries)
+        return None
+
+    def close(self):
+        """Flush queued changes, stop the flusher and close the database."""
+        with self._pending_cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._pending_cond.notify_all()
+        self._flusher.join(timeout=5)
+        self.flush()
+        with self._lock:
+            self._conn.close()
+            self._conn = None
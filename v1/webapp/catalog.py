@@ -0,0 +1,293 @@
+# in-memory copy of the contests table for the table endpoints
+#
+# the catalog only changes on refresh, so it is loaded once into columns:
+# subject, level and year are dictionary-encoded (each row stores a small code
+# into the sorted list of distinct values), every value keeps a bitset of the
+# rows that have it (a python int, bit i = row i), and every sortable column has
+# its row order precomputed in both directions. a filter is an OR of bitsets
+# within a column and an AND across columns; a sorted page is one pass over a
+# permutation.
+import re
+import json
+import base64
+import binascii
+from array import array
+from collections import namedtuple
+
+ContestRecord = namedtuple('ContestRecord', 'id subject level year level_sort pdf_link zip_link other_link')
+
+FILTER_COLUMNS = ('subject', 'level', 'year')
+
+
+# columns behind each table sort, None being the default order (subject, level, newest
+# year first). ties are broken by id in the sort's direction, so every order is total
+# and a page can continue from the last row's values (a keyset cursor).
+SORT_COLUMNS = {
+    'subject': ('subject',),
+    'level': ('level_sort', 'level'),
+    'year': ('year',),
+    # the status isn't part of the record: it comes from the download cache (status_bitsets())
+    'status': ('status_rank',),
+    None: ('subject', 'level_sort', 'level', 'year'),
+}
+
+
+def normalize_sort(sort_by, sort_dir):
+    """(sort_by, sort_dir) as used for ordering: unknown columns mean the default order."""
+    if sort_by not in SORT_COLUMNS or sort_by is None:
+        return None, 'asc'
+    return sort_by, ('desc' if sort_dir == 'desc' else 'asc')
+
+
+def sort_values(record, sort_by, status=None) -> tuple:
+    """
+    A row's sort column values followed by its id: the cursor for the page after it.
+    The status sort also needs the row's table status.
+    """
+    if sort_by == 'status':
+        return (STATUS_RANK[status], record.id)
+    return tuple(
+        # NULL level_sort sorts first, as in sqlite
+        (-1 if record.level_sort is None else record.level_sort) if column == 'level_sort' else getattr(record, column)
+        for column in SORT_COLUMNS[sort_by]
+    ) + (record.id,)
+
+
+def _order_key(values, sort_by):
+    if sort_by is None:
+        subject, level_sort, level, year, contest_id = values
+        return (subject, level_sort, level, -year, contest_id)
+    return tuple(values)
+
+
+def encode_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> tuple:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, binascii.Error):
+        raise ValueError(f"Invalid cursor: {token!r}")
+    if not isinstance(values, list) or not values:
+        raise ValueError(f"Invalid cursor: {token!r}")
+    return tuple(values)
+
+
+STATUSES = ('downloaded', 'partial', 'pending', 'no-links')  # in status sort order
+STATUS_RANK = {status: rank for rank, status in enumerate(STATUSES)}
+
+_ONE = re.compile('1')
+
+
+def contest_status(pdf_link, zip_link, pdf_state, zip_state) -> str:
+    """Table status of a contest. The 'other' link doesn't count towards completeness."""
+    pdf_downloaded = pdf_state if pdf_link else None
+    zip_downloaded = zip_state if zip_link else None
+    has_pdf = pdf_link is not None
+    has_zip = zip_link is not None
+    if not has_pdf and not has_zip:
+        return 'no-links'
+    if (not has_pdf or pdf_downloaded) and (not has_zip or zip_downloaded):
+        return 'downloaded'
+    if pdf_downloaded or zip_downloaded:
+        return 'partial'
+    return 'pending'
+
+
+def contest_complete(pdf_link, zip_link, other_link, states) -> bool:
+    """Whether every link a contest has, 'other' included, is downloaded (the API's downloaded filter)."""
+    return all(link is None or bool(link and state) for link, state in zip((pdf_link, zip_link, other_link), states))
+
+
+class CatalogIndex:
+    """Read-only columnar copy of the contests table. Build it with from_rows()."""
+
+    def __init__(self, records):
+        self.records = records  # row number -> ContestRecord, in id order
+        self.row_of = {record.id: row for row, record in enumerate(records)}
+        self.all_rows = (1 << len(records)) - 1
+
+        self.values = {}    # column -> distinct values, in display order
+        self.codes = {}     # column -> array of per-row codes into values[column]
+        self.postings = {}  # column -> {value: bitset of rows}
+        for column in FILTER_COLUMNS:
+            first = {}
+            for record in records:
+                first.setdefault(getattr(record, column), record)
+            if column == 'level':
+                values = sorted(first, key=lambda v: sort_values(first[v], 'level')[:-1])
+            else:
+                values = sorted(first)
+            if column == 'year':
+                values.reverse()  # newest first, like the filter dropdown
+            code_of = {value: code for code, value in enumerate(values)}
+            codes = array('I', (code_of[getattr(r, column)] for r in records))
+
+            # set bits in byte buffers first; or-ing 1 << i into big ints is quadratic
+            buffers = [bytearray((len(records) + 7) // 8) for _ in values]
+            for row, code in enumerate(codes):
+                buffers[code][row >> 3] |= 1 << (row & 7)
+            self.values[column] = values
+            self.codes[column] = codes
+            self.postings[column] = {
+                value: int.from_bytes(buffer, 'little') for value, buffer in zip(values, buffers)
+            }
+
+        # (sort_by, sort_dir) -> row numbers in that order, plus each row's rank in it
+        self._orders = {}
+        for sort_by in SORT_COLUMNS:
+            if sort_by == 'status':
+                continue  # changes with every download; see _select_by_status()
+            keys = [_order_key(sort_values(record, sort_by), sort_by) for record in records]
+            for sort_dir in ('asc', 'desc') if sort_by else ('asc',):
+                order = sorted(range(len(records)), key=keys.__getitem__, reverse=sort_dir == 'desc')
+                self._orders[sort_by, sort_dir] = self._with_ranks(order)
+
+    @staticmethod
+    def _with_ranks(order):
+        ranks = array('I', bytes(4 * len(order)))
+        for rank, row in enumerate(order):
+            ranks[row] = rank
+        return array('I', order), ranks
+
+    @classmethod
+    def from_rows(cls, rows):
+        """rows: (id, subject, level, year, level_sort, pdf_link, zip_link, other_link) tuples."""
+        return cls(sorted((ContestRecord(*row) for row in rows), key=lambda r: r.id))
+
+    def __len__(self):
+        return len(self.records)
+
+    def filter(self, subjects=(), levels=(), years=()) -> int:
+        """Bitset of the rows matching every given column (an empty selection matches all)."""
+        mask = self.all_rows
+        for column, selected in (('subject', subjects), ('level', levels), ('year', years)):
+            if not selected:
+                continue
+            postings = self.postings[column]
+            column_mask = 0
+            for value in selected:
+                column_mask |= postings.get(value, 0)
+            mask &= column_mask
+        return mask
+
+    def rows_mask(self, ids) -> int:
+        """Bitset of the rows with these contest ids (unknown ids are ignored)."""
+        buffer = bytearray((len(self.records) + 7) // 8)
+        for contest_id in ids:
+            row = self.row_of.get(contest_id)
+            if row is not None:
+                buffer[row >> 3] |= 1 << (row & 7)
+        return int.from_bytes(buffer, 'little')
+
+    def pick(self, ids, mask: int) -> list:
+        """The records for ids that are in mask, keeping the order of ids (e.g. search rank)."""
+        flags = mask.to_bytes((len(self.records) + 7) // 8, 'little')
+        rows = (self.row_of.get(contest_id) for contest_id in ids)
+        return [self.records[row] for row in rows if row is not None and flags[row >> 3] >> (row & 7) & 1]
+
+    def select(self, mask: int, sort_by=None, sort_dir='asc', after=None, limit=None, status_bitsets=None) -> list:
+        """
+        The records in mask, ordered like the SQL path would order them. after is a
+        cursor (sort_values() of the last row already shown); limit caps the page.
+        The status sort needs status_bitsets().
+        """
+        sort_by, sort_dir = normalize_sort(sort_by, sort_dir)
+        if sort_by == 'status':
+            return self._select_by_status(mask, sort_dir, status_bitsets, after, limit)
+        order, ranks = self._orders[sort_by, sort_dir]
+        start = 0 if after is None else self._position_after(after, sort_by, sort_dir, order, ranks)
+        end = len(order) if limit is None else start + limit
+        records = self.records
+        if mask == self.all_rows:
+            return [records[row] for row in order[start:end]]
+        if mask.bit_count() * 16 < len(records):
+            # few matches: pull out their row numbers and sort those by rank
+            rows = [m.start() for m in _ONE.finditer(format(mask, 'b')[::-1])]
+            rows = sorted((row for row in rows if ranks[row] >= start), key=ranks.__getitem__)
+            return [records[row] for row in rows[:limit]]
+        flags = mask.to_bytes((len(records) + 7) // 8, 'little')
+        page = []
+        for row in order[start:]:
+            if flags[row >> 3] >> (row & 7) & 1:
+                page.append(records[row])
+                if len(page) == limit:
+                    break
+        return page
+
+    def _select_by_status(self, mask, sort_dir, status_bitsets, after, limit) -> list:
+        # rows are in id order, so each status' rows come out of its bitset already sorted
+        descending = sort_dir == 'desc'
+        ranks = range(len(STATUSES))
+        page = []
+        for rank in (reversed(ranks) if descending else ranks):
+            if after is not None and (rank > after[0] if descending else rank < after[0]):
+                continue
+            rows = [m.start() for m in _ONE.finditer(format(mask & status_bitsets[STATUSES[rank]], 'b')[::-1])]
+            if descending:
+                rows.reverse()
+            for row in rows:
+                record = self.records[row]
+                if after is not None and rank == after[0] and \
+                        (record.id >= after[1] if descending else record.id <= after[1]):
+                    continue
+                page.append(record)
+                if len(page) == limit:
+                    return page
+        return page
+
+    def _position_after(self, after, sort_by, sort_dir, order, ranks) -> int:
+        row = self.row_of.get(after[-1])
+        if row is not None and sort_values(self.records[row], sort_by) == tuple(after):
+            return ranks[row] + 1
+        # that row changed or went away (a refresh between pages): find where it would sort
+        key = _order_key(after, sort_by)
+        for position, row in enumerate(order):
+            row_key = _order_key(sort_values(self.records[row], sort_by), sort_by)
+            if (row_key < key) if sort_dir == 'desc' else (row_key > key):
+                return position
+        return len(order)
+
+    def query(self, subjects=(), levels=(), years=(), sort_by=None, sort_dir='asc', ids=None,
+              restrict=None, after=None, limit=None, status_bitsets=None) -> list:
+        mask = self.filter(subjects, levels, years)
+        if ids is not None:
+            mask &= self.rows_mask(ids)
+        if restrict is not None:
+            mask &= restrict
+        return self.select(mask, sort_by, sort_dir, after, limit, status_bitsets)
+
+    def facet_counts(self, subjects=(), levels=(), years=(), restrict=None) -> dict:
+        """
+        {column: {value: count}} for every subject, level and year. A column is counted
+        under the other columns' selections (and restrict), so each count is what
+        ticking that value would match.
+        """
+        masks = {}
+        for column, selected in (('subject', subjects), ('level', levels), ('year', years)):
+            masks[column] = self.filter(**{column + 's': selected}) if selected else self.all_rows
+        if restrict is None:
+            restrict = self.all_rows
+        counts = {}
+        for column in FILTER_COLUMNS:
+            mask = restrict
+            for other in FILTER_COLUMNS:
+                if other != column:
+                    mask &= masks[other]
+            counts[column] = {value: (bits & mask).bit_count() for value, bits in self.postings[column].items()}
+        return counts
+
+    def status_bitsets(self, contest_state) -> dict:
+        """
+        {status: bitset of rows}, plus 'complete' (see contest_complete()), given
+        contest_state(id) -> (pdf, zip, other) downloaded flags.
+        """
+        buffers = {status: bytearray((len(self.records) + 7) // 8) for status in STATUSES + ('complete',)}
+        for row, record in enumerate(self.records):
+            states = contest_state(record.id)
+            status = contest_status(record.pdf_link, record.zip_link, states[0], states[1])
+            buffers[status][row >> 3] |= 1 << (row & 7)
+            if contest_complete(record.pdf_link, record.zip_link, record.other_link, states):
+                buffers['complete'][row >> 3] |= 1 << (row & 7)
+        return {status: int.from_bytes(buffer, 'little') for status, buffer in buffers.items()}
@@ -0,0 +1,199 @@
+# blue/green refresh of the catalog database (info.db)
+#
+# a refresh never writes to the live file: the catalog is copied to info.next.db,
+# updated there and renamed over info.db. the previous catalog is kept as
+# info.prev.db for rollback. a connection open at the rename keeps reading the
+# file it opened (on posix the old inode lives on until it is closed), so the swap
+# doesn't wait for anyone: it bumps a generation, idle connections are dropped and
+# busy ones are discarded when they are checked back in. new connections open the
+# new file.
+#
+# since nothing writes to the live file, the app's connections are opened read-only
+# and tuned for reads, and the metadata table is read once per swap.
+import os
+import sqlite3
+import time
+from pathlib import Path
+from sqlalchemy import event
+from setup.buildDB import repopulate_database
+from setup.mylogging import LOGGER as logger
+from webapp.cache_index import fsync_dir
+
+NEXT_SUFFIX = ".next.db"
+PREV_SUFFIX = ".prev.db"
+SWAP_TIMEOUT = 10  # seconds to retry a rename the os refuses while the file is open (windows)
+
+READ_PRAGMAS = (
+    'PRAGMA query_only = ON',
+    'PRAGMA mmap_size = 268435456',  # 256 MB, i.e. all of the catalog: reads skip the read() copy
+    'PRAGMA cache_size = -16384',    # 16 MB page cache per connection
+    'PRAGMA temp_store = MEMORY',    # ORDER BY scratch space
+)
+
+
+_engine = None
+_metadata = None  # the live catalog's metadata table, until the next swap
+_swaps = 0  # generation of the live file; connections remember the one they opened
+
+
+def _tune_connection(dbapi_connection, connection_record):
+    connection_record.info['catalog_generation'] = _swaps
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in READ_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
+def attach_engine(engine):
+    """
+    Make the app's engine's connections read-only and retire the ones opened before
+    a swap as they come back. Call after any schema setup.
+    """
+    global _engine
+    _engine = engine
+    event.listen(engine, "connect", _tune_connection)
+    event.listen(engine, "checkin", _retire_stale)
+    # connections opened before now (create_all) don't have the pragmas
+    engine.dispose()
+
+
+def _retire_stale(dbapi_connection, connection_record):
+    """A connection still on a swapped-out file is closed rather than pooled again."""
+    if dbapi_connection is not None and connection_record.info.get('catalog_generation') != _swaps:
+        connection_record.invalidate()
+
+
+def metadata() -> dict:
+    """The live catalog's metadata table as {key: value}, read once per swap."""
+    global _metadata
+    meta = _metadata
+    if meta is None:
+        swaps = _swaps
+        with _engine.connect() as conn:
+            meta = dict(conn.exec_driver_sql('SELECT key, value FROM metadata').fetchall())
+        # a swap in the meantime may have made this stale
+        if swaps == _swaps:
+            _metadata = meta
+    return meta
+
+
+def _sibling(db_path: Path, suffix: str) -> Path:
+    return db_path.with_name(db_path.stem + suffix)
+
+
+def _copy_database(src: Path, dst: Path):
+    """Consistent copy of a live database via the sqlite backup API, fsynced."""
+    if dst.exists():
+        dst.unlink()
+    source, target = sqlite3.connect(src), sqlite3.connect(dst)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    with open(dst, 'rb+') as f:
+        os.fsync(f.fileno())
+
+
+def _replace(new_file: Path, db_path: Path):
+    """os.replace, retried while the os refuses to rename over a file that is still open."""
+    deadline = time.monotonic() + SWAP_TIMEOUT
+    while True:
+        try:
+            os.replace(new_file, db_path)
+            return
+        except PermissionError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"catalog still in use after {SWAP_TIMEOUT}s")
+            # idle connections hold the file too; busy ones go when they are returned
+            if _engine is not None:
+                _engine.dispose()
+            time.sleep(0.1)
+
+
+def _swap_in(new_file: Path, db_path: Path):
+    """Rename new_file over db_path and move new connections onto it."""
+    global _metadata, _swaps
+    _replace(new_file, db_path)
+    fsync_dir(db_path.parent)
+    _metadata = None
+    _swaps += 1
+    if _engine is not None:
+        _engine.dispose()
+
+
+def _previous_source(info_json_path: Path) -> Path:
+    return info_json_path.with_name(info_json_path.stem + '.prev' + info_json_path.suffix)
+
+
+def _write_durably(path: Path, data: bytes):
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def refresh_catalog(info_json_path, db_path, previous_info=None) -> dict:
+    """
+    Build the new catalog next to the live one and swap it in. Returns the repopulate summary.
+
+    previous_info is the content of the info.json the live catalog was built from
+    (update_info has replaced the file by now). It is kept as info.prev.json next to
+    info.prev.db, so a rollback restores both and the database still matches its
+    source on the next start.
+    """
+    db_path = Path(db_path)
+    info_json_path = Path(info_json_path)
+    next_path = _sibling(db_path, NEXT_SUFFIX)
+    prev_path = _sibling(db_path, PREV_SUFFIX)
+    prev_source = _previous_source(info_json_path)
+
+    _copy_database(db_path, next_path)
+    try:
+        changes = repopulate_database(info_json_path=info_json_path, db_path=str(next_path))
+        with open(next_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        # refreshes are serialised by the caller, so the live file can't change under this copy
+        _copy_database(db_path, prev_path)
+        if previous_info is not None:
+            _write_durably(prev_source, previous_info)
+        elif prev_source.exists():
+            prev_source.unlink()  # belongs to an older catalog than the one kept now
+        _swap_in(next_path, db_path)
+    except Exception:
+        if next_path.exists():
+            next_path.unlink()
+        raise
+    logger.info(f"Catalog swapped in; previous catalog kept at {prev_path.name}")
+    return changes
+
+
+def has_previous(db_path) -> bool:
+    return _sibling(Path(db_path), PREV_SUFFIX).exists()
+
+
+def rollback_catalog(db_path, info_json_path=None) -> bool:
+    """
+    Swap the previous catalog back in, and its info.json if one was kept.
+    Returns False if there is none.
+    """
+    db_path = Path(db_path)
+    prev_path = _sibling(db_path, PREV_SUFFIX)
+    if not prev_path.exists():
+        return False
+    _swap_in(prev_path, db_path)
+    if info_json_path is not None:
+        info_json_path = Path(info_json_path)
+        prev_source = _previous_source(info_json_path)
+        if prev_source.exists():
+            os.replace(prev_source, info_json_path)
+            fsync_dir(info_json_path.parent)
+        else:
+            logger.warning(f"No {prev_source.name} to go with the previous catalog; "
+                           f"{info_json_path.name} is newer and will be rebuilt from on the next start")
+    logger.info("Catalog rolled back to the previous version")
+    return True
@@ -0,0 +1,178 @@
+# gzip/brotli for html fragments, json and the static assets
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from setup.mylogging import LOGGER as logger
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_SIZE = 1024  # smaller bodies aren't worth the cpu or the header
+COMPRESSIBLE = {'text/html', 'text/css', 'text/plain', 'application/json',
+                'application/javascript', 'text/javascript'}
+# dynamic bodies are compressed per request, so they get the cheap levels
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# static assets are compressed once, so they get the best
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+
+CACHE_ENTRIES = 64
+CACHE_BYTES = 16 * 1024 * 1024
+
+
+def encodings() -> list:
+    """Content codings we can produce, best first."""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress(body: bytes, encoding: str, static=False) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=STATIC_BROTLI_QUALITY if static else BROTLI_QUALITY)
+    # mtime=0 keeps the output (and so its cache entry) stable
+    return gzip.compress(body, compresslevel=STATIC_GZIP_LEVEL if static else GZIP_LEVEL, mtime=0)
+
+
+def variant_tag(etag: str, encoding: str) -> str:
+    """Strong ETag of the encoded representation; each coding needs its own."""
+    return f'{etag}-{encoding}'
+
+
+class ResponseCompressor:
+    """
+    Negotiates Content-Encoding for Flask responses. Encoded dynamic bodies are kept
+    in a small LRU keyed by ETag (or a digest of the body), static files are
+    compressed once per mtime at the best levels. Per-endpoint byte counts are kept
+    for the metrics endpoint.
+    """
+
+    def __init__(self, static_folder):
+        self.static_folder = Path(static_folder)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # (tag or digest, encoding) -> encoded body
+        self._cache_bytes = 0
+        self._static = {}  # (filename, encoding) -> (mtime_ns, encoded body)
+        self._stats = {}  # endpoint -> counters
+
+    def negotiate(self, accept_encodings):
+        """Best coding the client accepts, or None for identity."""
+        return accept_encodings.best_match(encodings()) if accept_encodings else None
+
+    def process(self, response, accept_encodings, endpoint, view_args=None):
+        """Encode response in place if it is worth it and the client accepts it."""
+        if response.mimetype not in COMPRESSIBLE:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate(accept_encodings)
+        if encoding is None or 'Content-Encoding' in response.headers:
+            return response
+
+        etag, weak = response.get_etag()
+        if response.status_code == 304:
+            # name the variant the client holds
+            if etag and endpoint == 'static':
+                response.set_etag(etag, weak=True)
+            elif etag and not weak:
+                response.set_etag(variant_tag(etag, encoding))
+            return response
+        if response.status_code != 200 or 'Content-Range' in response.headers:
+            return response
+
+        if endpoint == 'static':
+            body = self._static_body((view_args or {}).get('filename'), encoding)
+            if body is None:
+                return response
+            raw_size = response.content_length
+            if hasattr(response.response, 'close'):
+                response.response.close()  # the file send_file opened
+            response.direct_passthrough = False
+            response.headers.pop('Accept-Ranges', None)
+            cached = True
+            if etag:
+                # same file, different bytes: only weakly equal to the identity tag
+                response.set_etag(etag, weak=True)
+        else:
+            if response.direct_passthrough or response.is_streamed:
+                return response
+            raw = response.get_data()
+            raw_size = len(raw)
+            if raw_size < MIN_SIZE:
+                return response
+            key = etag if etag and not weak else hashlib.blake2b(raw, digest_size=16).digest()
+            body, cached = self._encoded(key, raw, encoding)
+            if etag and not weak:
+                response.set_etag(variant_tag(etag, encoding))
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        self._count(endpoint, raw_size or 0, len(body), cached)
+        return response
+
+    def _encoded(self, key, raw, encoding):
+        slot = (key, encoding)
+        with self._lock:
+            body = self._cache.get(slot)
+            if body is not None:
+                self._cache.move_to_end(slot)
+                return body, True
+        body = compress(raw, encoding)
+        with self._lock:
+            if slot not in self._cache:
+                self._cache[slot] = body
+                self._cache_bytes += len(body)
+                while self._cache and (len(self._cache) > CACHE_ENTRIES or self._cache_bytes > CACHE_BYTES):
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cache_bytes -= len(evicted)
+        return body, False
+
+    def _static_body(self, filename, encoding):
+        if not filename:
+            return None
+        path = self.static_folder / filename
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            return None
+        entry = self._static.get((filename, encoding))
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+        try:
+            body = compress(path.read_bytes(), encoding, static=True)
+        except OSError as e:
+            logger.warning(f"Could not compress {filename}: {e}")
+            return None
+        self._static[(filename, encoding)] = (mtime, body)
+        return body
+
+    def precompress(self, filenames):
+        """Compress static assets ahead of the first request."""
+        for filename in filenames:
+            for encoding in encodings():
+                self._static_body(filename, encoding)
+
+    def _count(self, endpoint, raw_size, sent_size, cached):
+        with self._lock:
+            counters = self._stats.setdefault(endpoint or 'unknown', {
+                'responses': 0, 'raw_bytes': 0, 'sent_bytes': 0, 'cache_hits': 0})
+            counters['responses'] += 1
+            counters['raw_bytes'] += raw_size
+            counters['sent_bytes'] += sent_size
+            counters['cache_hits'] += int(cached)
+
+    def stats(self) -> dict:
+        with self._lock:
+            endpoints = {
+                name: dict(c, saved_bytes=c['raw_bytes'] - c['sent_bytes'])
+                for name, c in self._stats.items()
+            }
+            return {
+                'encodings': encodings(),
+                'cached_bodies': len(self._cache),
+                'cached_bytes': self._cache_bytes,
+                'endpoints': endpoints,
+                'saved_bytes': sum(c['saved_bytes'] for c in endpoints.values()),
+            }
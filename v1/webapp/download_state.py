@@ -0,0 +1,163 @@
+# the download cache's per-contest state, mirrored into sqlite so the table's status
+# filter and sort can join against contests and run (with their LIMIT) in the database
+#
+# info.db is read-only and swapped on refresh, so the mirror is a file of its own,
+# attached to every catalog connection as "state". only contests with a downloaded
+# file have a row: its pdf/zip/other flags and, written with them, its status rank
+# and completeness, so the status filter is an index lookup. every other contest is
+# 'pending' or 'no-links', which the queries work out from its links.
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from sqlalchemy import MetaData, Table, Column, Integer, event, case, and_, or_, func
+from setup.mylogging import LOGGER as logger
+from webapp.catalog import STATUS_RANK, contest_status, contest_complete
+
+SCHEMA = 'state'
+
+download_state = Table(
+    'download_state', MetaData(),
+    Column('contest_id', Integer, primary_key=True),
+    Column('pdf', Integer, nullable=False),
+    Column('zip', Integer, nullable=False),
+    Column('other', Integer, nullable=False),
+    Column('status_rank', Integer, nullable=False),
+    Column('complete', Integer, nullable=False),
+    schema=SCHEMA,
+)
+COLUMNS = {column.name for column in download_state.columns}
+
+
+def _create_schema(conn: sqlite3.Connection):
+    # the mirror is rebuilt on open anyway, so one with other columns is just dropped
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(download_state)')}
+    if columns and columns != COLUMNS:
+        conn.execute('DROP TABLE download_state')
+    conn.execute('''CREATE TABLE IF NOT EXISTS download_state (
+        contest_id INTEGER PRIMARY KEY,
+        pdf INTEGER NOT NULL,
+        zip INTEGER NOT NULL,
+        other INTEGER NOT NULL,
+        status_rank INTEGER NOT NULL,
+        complete INTEGER NOT NULL
+    )''')
+    conn.execute('DROP INDEX IF EXISTS idx_download_state_status')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_download_state_rank ON download_state (status_rank, contest_id)')
+
+
+class DownloadStateMirror:
+    """
+    SQLite copy of DownloadCache's contest states. sync() is called before a query
+    that needs it and writes only the rows that changed since the last sync.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        # readers (the catalog connections) never block the sync, and the other way round
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        with self._conn:
+            _create_schema(self._conn)
+            # it is derived state; start from nothing rather than trust a previous run
+            self._conn.execute('DELETE FROM download_state')
+        self._key = None
+        self._rows = {}  # contest id -> row as written
+
+        self.syncs = 0
+        self.rows_written = 0
+        self._last_sync_ms = None
+
+    def attach(self, engine):
+        """Attach the mirror to every connection of engine (as schema "state")."""
+        event.listen(engine, "connect", self._attach_connection)
+        engine.dispose()
+
+    def _attach_connection(self, dbapi_connection, connection_record):
+        dbapi_connection.execute(f'ATTACH DATABASE ? AS {SCHEMA}', (str(self.path),))
+
+    def sync(self, key, states, links_of):
+        """
+        Bring the mirror in line with states ({contest id: (pdf, zip, other)}, from
+        DownloadCache.downloaded_contests()). links_of(ids) gives {contest id: (pdf_link,
+        zip_link, other_link)} for the status columns. key identifies that state;
+        syncing the same key again is free.
+        """
+        with self._lock:
+            if key == self._key:
+                return
+            started = time.perf_counter()
+            links = links_of(list(states))
+            rows = {}
+            for contest_id, flags in states.items():
+                contest_links = links.get(contest_id)
+                if contest_links is None:
+                    continue
+                status = contest_status(contest_links[0], contest_links[1], flags[0], flags[1])
+                complete = contest_complete(*contest_links, flags)
+                rows[contest_id] = tuple(int(flag) for flag in flags) + (STATUS_RANK[status], int(complete))
+            changed = [(contest_id,) + row for contest_id, row in rows.items() if self._rows.get(contest_id) != row]
+            removed = [(contest_id,) for contest_id in self._rows if contest_id not in rows]
+            try:
+                with self._conn:
+                    self._conn.executemany('INSERT OR REPLACE INTO download_state VALUES (?, ?, ?, ?, ?, ?)', changed)
+                    self._conn.executemany('DELETE FROM download_state WHERE contest_id = ?', removed)
+            except sqlite3.Error as e:
+                logger.error(f"Error syncing download state: {e}")
+                return
+            self._rows = rows
+            self._key = key
+            self.syncs += 1
+            self.rows_written += len(changed) + len(removed)
+            self._last_sync_ms = (time.perf_counter() - started) * 1000
+
+    def stats(self) -> dict:
+        return {
+            'rows': len(self._rows),
+            'syncs': self.syncs,
+            'rows_written': self.rows_written,
+            'last_sync_ms': round(self._last_sync_ms, 3) if self._last_sync_ms is not None else None,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# query pieces for contests outer-joined to download_state
+
+def _no_links(contest):
+    return and_(contest.pdf_link.is_(None), contest.zip_link.is_(None))
+
+
+def status_rank(contest):
+    """ORDER BY expression for the table status (see catalog.STATUSES)."""
+    return func.coalesce(download_state.c.status_rank,
+                         case((_no_links(contest), STATUS_RANK['no-links']), else_=STATUS_RANK['pending']))
+
+
+def needs_inner_join(downloaded) -> bool:
+    """The 'true' and 'partial' filters only match contests with a downloaded file."""
+    return downloaded in ('true', 'partial')
+
+
+def status_clause(downloaded):
+    """WHERE clause for the table's status filter ('true', 'false', 'partial'), or None."""
+    rank = download_state.c.status_rank
+    if downloaded == 'true':
+        return rank == STATUS_RANK['downloaded']
+    if downloaded == 'partial':
+        return rank == STATUS_RANK['partial']
+    if downloaded == 'false':
+        return or_(rank.is_(None), rank != STATUS_RANK['downloaded'])
+    return None
+
+
+def complete_clause(contest, complete: bool):
+    """WHERE clause for contests whose every link is (or isn't) downloaded; see catalog.contest_complete."""
+    state = download_state.c
+    no_links = and_(_no_links(contest), contest.other_link.is_(None))
+    if complete:
+        return or_(state.complete == 1, and_(state.contest_id.is_(None), no_links))
+    return or_(state.complete == 0, and_(state.contest_id.is_(None), ~no_links))
@@ -0,0 +1,104 @@
+# cache of rendered /contests fragments
+#
+# the table is re-requested all the time with nothing changed (after every batch,
+# when the tab regains focus, when a sort is toggled back), so rendered html is kept
+# per filter. entries belong to a version - (catalog version, download dir,
+# download-cache generation) - and a fragment rendered for a newer version drops
+# everything older, so a download, refresh or reset invalidates exactly when it
+# changes what the table shows.
+import threading
+from collections import OrderedDict
+
+MAX_ENTRIES = 128
+MAX_BYTES = 32 * 1024 * 1024
+
+
+class _Flight:
+    """A render in progress that identical requests wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.body = None
+
+
+class FragmentCache:
+    """LRU of rendered fragments with single-flight rendering of misses."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (version, key) -> body
+        self._bytes = 0
+        self._version = None
+        self._inflight = {}  # (version, key) -> _Flight
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def get(self, version, key, render):
+        """The body for key at version, calling render() at most once across concurrent callers."""
+        slot = (version, key)
+        with self._lock:
+            body = self._entries.get(slot)
+            if body is not None:
+                self._entries.move_to_end(slot)
+                self.hits += 1
+                return body
+            flight = self._inflight.get(slot)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[slot] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.body is not None:
+                return flight.body
+            return render()  # the leader failed; don't share its error
+
+        try:
+            flight.body = render()
+        finally:
+            with self._lock:
+                del self._inflight[slot]
+                if flight.body is not None:
+                    self._store(slot, flight.body)
+            flight.done.set()
+        return flight.body
+
+    def _store(self, slot, body):
+        version = slot[0]
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+        self._entries[slot] = body
+        self._bytes += len(body)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'invalidations': self.invalidations,
+                'hit_rate': round((self.hits + self.coalesced) / lookups, 3) if lookups else None,
+            }
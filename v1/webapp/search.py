@@ -0,0 +1,81 @@
+# search over the catalog, backed by the contests_fts index that setup/buildDB.py
+# builds next to the contests table
+import re
+import difflib
+from sqlalchemy import text
+from setup.mylogging import LOGGER as logger
+
+# bm25 column weights: subject, level, year, filenames
+RANK = 'bm25(contests_fts, 10.0, 4.0, 4.0, 1.0)'
+TRIGRAM_MIN = 3  # the trigram tokenizer can't match anything shorter
+TYPO_CUTOFF = 0.75
+
+
+def _terms(q: str) -> list:
+    return re.findall(r'\w+', q.lower())
+
+
+def _tokenizer(session):
+    try:
+        row = session.execute(text("SELECT value FROM metadata WHERE key = 'search_tokenizer'")).fetchone()
+    except Exception:
+        return None
+    return row[0] if row else None
+
+
+def _ranked_ids(session, terms, tokenizer) -> list:
+    params = {}
+    like = []
+    match = []
+    for n, term in enumerate(terms):
+        if tokenizer == 'trigram' and len(term) >= TRIGRAM_MIN:
+            match.append(f'"{term}"')
+        elif tokenizer == 'unicode61':
+            match.append(f'"{term}"*')
+        else:
+            params[f't{n}'] = f'%{term}%'
+            like.append(n)
+
+    if tokenizer is None:
+        # no FTS5: substring match over the table itself
+        haystack = ("subject || ' ' || level || ' ' || year || ' ' || "
+                    "coalesce(pdf_link, '') || ' ' || coalesce(zip_link, '') || ' ' || coalesce(other_link, '')")
+        where = ' AND '.join(f'{haystack} LIKE :t{n}' for n in like)
+        sql = f'SELECT id FROM contests WHERE {where} ORDER BY subject, level_sort, year DESC'
+    else:
+        haystack = "subject || ' ' || level || ' ' || year || ' ' || filenames"
+        clauses = [f'{haystack} LIKE :t{n}' for n in like]
+        if match:
+            params['match'] = ' '.join(match)
+            clauses.insert(0, 'contests_fts MATCH :match')
+            order = RANK
+        else:
+            order = 'subject, year DESC'
+        sql = f"SELECT rowid FROM contests_fts WHERE {' AND '.join(clauses)} ORDER BY {order}"
+    return [row[0] for row in session.execute(text(sql), params)]
+
+
+def search_ids(session, q: str, vocabulary=(), metadata=None) -> tuple:
+    """
+    Contest ids matching every term of q, best first. If nothing matches, each term
+    is swapped for its closest word from vocabulary and the search is retried.
+    metadata, if given, is the catalog's metadata table (saves reading it per search).
+    Returns (ids, corrected query or None).
+    """
+    terms = _terms(q)
+    if not terms:
+        return [], None
+    tokenizer = metadata.get('search_tokenizer') if metadata is not None else _tokenizer(session)
+    ids = _ranked_ids(session, terms, tokenizer)
+    if ids or not vocabulary:
+        return ids, None
+
+    words = sorted({w for value in vocabulary for w in _terms(str(value))})
+    corrected = []
+    for term in terms:
+        close = difflib.get_close_matches(term, words, n=1, cutoff=TYPO_CUTOFF)
+        corrected.append(close[0] if close else term)
+    if corrected == terms:
+        return [], None
+    logger.info(f"Search for {q!r} found nothing; trying {' '.join(corrected)!r}")
+    return _ranked_ids(session, corrected, tokenizer), ' '.join(corrected)
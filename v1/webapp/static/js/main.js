@@ -10,6 +10,25 @@ document.addEventListener('DOMContentLoaded', function() {
     // simple select-all functionality - complex UI that benefits from client-side handling
     // Note: selectAllCheckbox is now loaded dynamically via HTMX, so we use event delegation
 
+    /* ---------- selection state ---------- */
+    // the table loads page by page, so "select all" selects the whole filter rather
+    // than the rows in the DOM; files unticked afterwards are remembered as exclusions
+    let selectAllByFilter = false;
+    const excludedFiles = new Set();  // "id:type"
+
+    const fileKey = cb => `${cb.getAttribute('data-id')}:${cb.getAttribute('data-type')}`;
+
+    function trackSelection(checkbox) {
+        if (!selectAllByFilter) return;
+        if (checkbox.checked) excludedFiles.delete(fileKey(checkbox));
+        else excludedFiles.add(fileKey(checkbox));
+    }
+
+    function resetSelection() {
+        selectAllByFilter = false;
+        excludedFiles.clear();
+    }
+
     /* ---------- sync helpers ---------- */
     function updateRowCheckbox(row) {
         const rowBox = row.querySelector('.row-checkbox');
@@ -48,18 +67,25 @@ document.addEventListener('DOMContentLoaded', function() {
             // All available files on the page are already downloaded.
             selectAllCheckbox.disabled = true;
             selectAllCheckbox.checked = true;
+        } else if (selectAllByFilter) {
+            // everything matching the filter, possibly minus a few unticked files
+            selectAllCheckbox.disabled = false;
+            selectAllCheckbox.checked = excludedFiles.size === 0;
+            selectAllCheckbox.indeterminate = excludedFiles.size > 0;
+            return;
         } else {
             // There are still some files that can be selected.
             selectAllCheckbox.disabled = false;
             selectAllCheckbox.checked = Array.from(allSelectable).every(cb => cb.checked);
         }
+        selectAllCheckbox.indeterminate = false;
     }
 
     function updateDownloadButton() {
         const downloadBtn = document.getElementById('download-selected');
         const checkedBoxes = document.querySelectorAll('.packet-checkbox:checked:not(:disabled), .datafile-checkbox:checked:not(:disabled)');
         if (downloadBtn) {
-            downloadBtn.disabled = checkedBoxes.length === 0;
+            downloadBtn.disabled = checkedBoxes.length === 0 && !selectAllByFilter;
         }
     }
     /* ----------------------------------- */
@@ -67,6 +93,8 @@ document.addEventListener('DOMContentLoaded', function() {
     // select all functionality using event delegation (since checkbox is loaded via HTMX)
     document.addEventListener('change', function(e) {
         if (e.target.id === 'select-all') {
+            resetSelection();
+            selectAllByFilter = e.target.checked;
             const checkboxes = document.querySelectorAll('.packet-checkbox:not(:disabled), .datafile-checkbox:not(:disabled)');
             checkboxes.forEach(checkbox => { checkbox.checked = e.target.checked; });
             // toggle row-level checkboxes to match global selection
@@ -99,6 +127,35 @@ document.addEventListener('DOMContentLoaded', function() {
         renderFilterTags();
     }
 
+    // Facet counts -------------------------------------------------
+    // every filter option shows how many contests it would match under the other filters
+    const facetParams = { subjects: 'subject', levels: 'level', years: 'year', downloaded: 'downloaded', q: 'q' };
+
+    function refreshFacetCounts() {
+        if (!filterForm) return;
+        const params = new URLSearchParams();
+        new FormData(filterForm).forEach((value, name) => {
+            if (facetParams[name] && value !== '') params.append(facetParams[name], value);
+        });
+        fetch(`/api/facets?${params}`)
+            .then(response => response.json())
+            .then(counts => {
+                if (counts.error) return;
+                filterForm.querySelectorAll('.facet-count').forEach(span => {
+                    const count = (counts[span.dataset.facet] || {})[span.dataset.value] ?? 0;
+                    span.textContent = count;
+                    // dim options that would match nothing (unless already ticked)
+                    const label = span.closest('label');
+                    const input = label.querySelector('input');
+                    label.classList.toggle('opacity-50', count === 0 && !input.checked);
+                });
+                filterForm.querySelectorAll('#downloaded-filter option[data-label]').forEach(option => {
+                    option.textContent = `${option.dataset.label} (${counts.downloaded[option.value] ?? 0})`;
+                });
+            })
+            .catch(err => console.error('Error loading facet counts:', err));
+    }
+
     document.addEventListener('click', function(e) {
         if (e.target.classList.contains('remove-tag')) {
             const name = e.target.getAttribute('data-name');
@@ -117,6 +174,7 @@ document.addEventListener('DOMContentLoaded', function() {
     document.addEventListener('change', function(e) {
         if (e.target.classList.contains('packet-checkbox') || 
             e.target.classList.contains('datafile-checkbox')) {
+            trackSelection(e.target);
             const row = e.target.closest('tr');
             if (row) updateRowCheckbox(row);
             updateDownloadButton();
@@ -130,7 +188,10 @@ document.addEventListener('DOMContentLoaded', function() {
             const row = e.target.closest('tr');
             if (row) {
                 const selectable = row.querySelectorAll('.packet-checkbox:not(:disabled), .datafile-checkbox:not(:disabled)');
-                selectable.forEach(cb => cb.checked = e.target.checked);
+                selectable.forEach(cb => {
+                    cb.checked = e.target.checked;
+                    trackSelection(cb);
+                });
                 updateRowCheckbox(row);
             }
             updateDownloadButton();
@@ -143,13 +204,25 @@ document.addEventListener('DOMContentLoaded', function() {
     if (downloadSelectedBtn) {
         downloadSelectedBtn.addEventListener('click', function() {
             const selectedBoxes = document.querySelectorAll('.packet-checkbox:checked:not(:disabled), .datafile-checkbox:checked:not(:disabled)');
-            if (selectedBoxes.length === 0) return;
+            if (selectedBoxes.length === 0 && !selectAllByFilter) return;
 
-            // build payload of selected files
-            const payload = Array.from(selectedBoxes).map(cb => ({
-                id: cb.getAttribute('data-id'),
-                type: cb.getAttribute('data-type')
-            }));
+            // build payload: the selected files, or the whole filter when "select all" is on
+            let body;
+            if (selectAllByFilter) {
+                const filter = {};
+                new FormData(filterForm).forEach((value, name) => {
+                    (filter[name] = filter[name] || []).push(value);
+                });
+                body = { filter: filter, exclude: Array.from(excludedFiles, key => {
+                    const [id, type] = key.split(':');
+                    return { id, type };
+                }) };
+            } else {
+                body = { items: Array.from(selectedBoxes).map(cb => ({
+                    id: cb.getAttribute('data-id'),
+                    type: cb.getAttribute('data-type')
+                })) };
+            }
 
             // swap each checkbox UI to spinner
             selectedBoxes.forEach(cb => {
@@ -169,12 +242,23 @@ document.addEventListener('DOMContentLoaded', function() {
                 headers: {
                     'Content-Type': 'application/json'
                 },
-                body: JSON.stringify({ items: payload })
+                body: JSON.stringify(body)
             })
             .then(res => res.json())
             .then(data => {
                 console.log('Batch download response', data);
 
+                // batch refused up front (e.g. not enough disk space)
+                if (data && data.success === false) {
+                    let message = data.error || 'Batch download was refused.';
+                    if (data.plan) {
+                        const mb = bytes => (bytes / 1024 / 1024).toFixed(1);
+                        message += `\n\nNeeded: ${mb(data.plan.known_bytes)} MB, free: ${mb(data.plan.free_bytes)} MB`;
+                    }
+                    alert(message);
+                    throw new Error(message);
+                }
+
                 // replace spinner with checkmark per result
                 if (data && Array.isArray(data.results)) {
                     data.results.forEach(result => {
@@ -206,6 +290,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 downloadSelectedBtn.disabled = false;
                 downloadSelectedBtn.textContent = 'Download Selected';
                 // clear selections
+                resetSelection();
                 selectedBoxes.forEach(cb => cb.checked = false);
                 document.querySelectorAll('tbody tr').forEach(updateRowCheckbox);
                 updateDownloadButton();
@@ -218,10 +303,27 @@ document.addEventListener('DOMContentLoaded', function() {
     document.addEventListener('htmx:afterSwap', function(e) {
         // only update if this was a table swap
         if (e.target.id === 'table-container') {
+            // a new filter or sort starts a new selection
+            resetSelection();
             document.querySelectorAll('tbody tr').forEach(updateRowCheckbox);
             updateDownloadButton();
             updateSelectAll();
+            // filters or download states changed
+            refreshFacetCounts();
+        }
+    });
+
+    // rows appended as the table scrolls
+    htmx.onLoad(function(elt) {
+        if (elt.tagName !== 'TR' || !elt.closest('#contests-table-body')) return;
+        if (selectAllByFilter) {
+            elt.querySelectorAll('.packet-checkbox:not(:disabled), .datafile-checkbox:not(:disabled)').forEach(cb => {
+                cb.checked = !excludedFiles.has(fileKey(cb));
+            });
         }
+        updateRowCheckbox(elt);
+        updateDownloadButton();
+        updateSelectAll();
     });
 });
 
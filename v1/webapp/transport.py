@@ -0,0 +1,347 @@
+# pluggable http transports for catalog downloads, with connection warm-up
+import asyncio
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+from setup.mylogging import LOGGER as logger
+from config import data_path
+
+# used when no local info.json is around yet
+DEFAULT_CATALOG_HOSTS = ["https://www.uiltexas.org"]
+
+POOL_SIZE = 8               # pooled connections kept per host
+WARM_CONNECTIONS = 4        # connections opened per host during warm-up
+KEEPALIVE_INTERVAL = 15     # seconds between keep-alive pings until first use
+KEEPALIVE_LIMIT = 300       # give up keeping connections warm after this long
+H2_MAX_FAILURES = 3         # http/2 connection failures before sticking to http/1.1
+H2_BATCH_BYTES = 256 * 1024  # body bytes handed over per trip to the http/2 loop thread
+
+
+class TransportResponse:
+    """A streamed response: headers, body chunks and close()."""
+
+    def __init__(self, headers, iter_bytes, close):
+        self.headers = headers
+        self.iter_bytes = iter_bytes
+        self.close = close
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Http1Transport:
+    """HTTP/1.1 over a pooled requests session (one connection per concurrent transfer)."""
+    name = "http1"
+    connection_errors = (requests.ConnectionError,)
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def head(self, url: str, timeout: float, allow_redirects: bool = True):
+        response = self.session.head(url, timeout=timeout, allow_redirects=allow_redirects, verify=False)
+        response.raise_for_status()
+        return response.headers
+
+    def get(self, url: str, timeout: float) -> TransportResponse:
+        response = self.session.get(url, timeout=timeout, stream=True, verify=False)
+        try:
+            response.raise_for_status()
+        except Exception:
+            response.close()
+            raise
+        return TransportResponse(
+            response.headers,
+            lambda chunk_size: response.iter_content(chunk_size=chunk_size),
+            response.close,
+        )
+
+    def ping(self, origin: str):
+        self.session.head(origin + "/", timeout=5, allow_redirects=False, verify=False)
+
+    def close(self):
+        self.session.close()
+
+
+class Http2Transport:
+    """HTTP/2 through httpx: concurrent transfers share one multiplexed connection per host.
+
+    Needs the optional `httpx[http2]` packages. Servers without h2 support are
+    negotiated down to HTTP/1.1 by ALPN. The client runs on its own event loop
+    thread because httpx's sync h2 connection can't be shared between threads.
+    """
+    name = "http2"
+
+    def __init__(self, prior_knowledge: bool = False):
+        import httpx  # optional dependency; ImportError means "not available"
+        import h2  # noqa: F401  (httpx needs it for http2=True)
+        self.connection_errors = (httpx.TransportError,)
+        # httpx logs every request at INFO; keep the app log readable
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="uildl-http2", daemon=True).start()
+
+        async def _make_client():
+            # prior_knowledge speaks h2 straight away (h2c), e.g. for local test servers
+            return httpx.AsyncClient(
+                http1=not prior_knowledge,
+                http2=True,
+                verify=False,
+                limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+            )
+        self.client = self._run(_make_client())
+
+    def _run(self, coro):
+        """Run a coroutine on the transport's loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def head(self, url: str, timeout: float, allow_redirects: bool = True):
+        response = self._run(self.client.head(url, timeout=timeout, follow_redirects=allow_redirects))
+        response.raise_for_status()
+        return response.headers
+
+    def get(self, url: str, timeout: float) -> TransportResponse:
+        async def _open():
+            request = self.client.build_request("GET", url, timeout=timeout)
+            return await self.client.send(request, stream=True, follow_redirects=True)
+
+        response = self._run(_open())
+        try:
+            response.raise_for_status()
+        except Exception:
+            self._run(response.aclose())
+            raise
+
+        def iter_bytes(chunk_size: int):
+            chunks = response.aiter_bytes(chunk_size)
+
+            # every trip to the loop thread costs a wake-up on both sides, so collect
+            # a batch of chunks per trip rather than making one for each chunk
+            async def _next_batch():
+                batch, size = [], 0
+                async for chunk in chunks:
+                    batch.append(chunk)
+                    size += len(chunk)
+                    if size >= H2_BATCH_BYTES:
+                        break
+                return batch
+
+            while batch := self._run(_next_batch()):
+                yield from batch
+
+        return TransportResponse(response.headers, iter_bytes, lambda: self._run(response.aclose()))
+
+    def ping(self, origin: str):
+        self._run(self.client.head(origin + "/", timeout=5))
+
+    def close(self):
+        self._run(self.client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+class FallbackTransport:
+    """Use the primary transport, retrying on the fallback when its connections fail.
+
+    That includes a body that breaks off part way: it is fetched again on the
+    fallback, skipping the bytes already handed out. After H2_MAX_FAILURES
+    connection-level failures the primary is dropped for good.
+    """
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.primary.name if self.primary else self.fallback.name
+
+    def _call(self, method: str, *args, **kwargs):
+        primary = self.primary
+        if primary is not None:
+            try:
+                return getattr(primary, method)(*args, **kwargs)
+            except primary.connection_errors as e:
+                self._failed(primary, e)
+        return getattr(self.fallback, method)(*args, **kwargs)
+
+    def _failed(self, primary, error):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= H2_MAX_FAILURES and self.primary is not None:
+                logger.warning(f"{primary.name} keeps failing; switching to {self.fallback.name}")
+                self.primary = None
+        logger.warning(f"{primary.name} request failed ({error}); retrying with {self.fallback.name}")
+
+    def head(self, url: str, timeout: float, allow_redirects: bool = True):
+        return self._call("head", url, timeout, allow_redirects)
+
+    def get(self, url: str, timeout: float) -> TransportResponse:
+        primary = self.primary
+        if primary is None:
+            return self.fallback.get(url, timeout)
+        try:
+            response = primary.get(url, timeout)
+        except primary.connection_errors as e:
+            self._failed(primary, e)
+            return self.fallback.get(url, timeout)
+
+        current = [response]  # the response the body is read from, for close()
+
+        def iter_bytes(chunk_size: int):
+            sent = 0
+            try:
+                for chunk in response.iter_bytes(chunk_size):
+                    sent += len(chunk)
+                    yield chunk
+                return
+            except primary.connection_errors as e:
+                self._failed(primary, e)
+            _close_quietly(response)
+            retry = current[0] = self.fallback.get(url, timeout)
+            skip = sent
+            for chunk in retry.iter_bytes(chunk_size):
+                if skip >= len(chunk):
+                    skip -= len(chunk)
+                    continue
+                yield chunk[skip:]
+                skip = 0
+
+        return TransportResponse(response.headers, iter_bytes, lambda: current[0].close())
+
+    def ping(self, origin: str):
+        return self._call("ping", origin)
+
+    def close(self):
+        if self.primary is not None:
+            self.primary.close()
+        self.fallback.close()
+
+
+def _close_quietly(response: TransportResponse):
+    try:
+        response.close()
+    except Exception as e:
+        logger.debug(f"Error closing a broken response: {e}")
+
+
+def create_transport(name: str):
+    """Build the transport selected in config ('http1' or 'http2')."""
+    if name == "http2":
+        try:
+            return FallbackTransport(Http2Transport(), Http1Transport())
+        except ImportError as e:
+            logger.warning(f"HTTP/2 transport unavailable ({e}); using HTTP/1.1. Install httpx[http2] to enable it.")
+    elif name not in ("http1", None):
+        logger.warning(f"Unknown http_transport '{name}' in config; using HTTP/1.1")
+    return Http1Transport()
+
+
+def _configured_transport_name():
+    try:
+        with open(data_path / "config.cfg", "r") as f:
+            return json.load(f).get("http_transport")
+    except (IOError, ValueError):
+        return None
+
+
+_transport = None
+_transport_lock = threading.Lock()
+_first_use = threading.Event()
+
+
+def _get_transport():
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = create_transport(_configured_transport_name())
+            logger.info(f"Using {_transport.name} transport for downloads")
+        return _transport
+
+
+def get_transport():
+    """Return the shared download transport. Marks the warmed connections as used."""
+    _first_use.set()
+    return _get_transport()
+
+
+def catalog_hosts(info_json_path: Path) -> list[str]:
+    """Collect the origins (scheme://host) that the catalog links point to."""
+    try:
+        with open(info_json_path, "r") as f:
+            linkdata = json.load(f).get("linkdata", {})
+    except (IOError, ValueError) as e:
+        logger.info(f"No usable info.json for warm-up ({e}); using default hosts")
+        return list(DEFAULT_CATALOG_HOSTS)
+
+    counts: dict[str, int] = {}
+    for url in linkdata.values():
+        parts = urlsplit(url)
+        if parts.scheme and parts.netloc:
+            origin = f"{parts.scheme}://{parts.netloc}"
+            counts[origin] = counts.get(origin, 0) + 1
+    # most used hosts first
+    hosts = sorted(counts, key=counts.get, reverse=True)
+    return hosts or list(DEFAULT_CATALOG_HOSTS)
+
+
+def _ping(origin: str):
+    """Open (or reuse) a pooled connection to origin with a cheap HEAD request."""
+    try:
+        _get_transport().ping(origin)
+    except Exception as e:
+        logger.info(f"Warm-up request to {origin} failed: {e}")
+
+
+def warm_up(hosts: list[str], connections: int = WARM_CONNECTIONS):
+    """Resolve and connect to each host in parallel, filling the connection pool."""
+    started = time.monotonic()
+    threads = []
+    for origin in hosts:
+        # concurrent requests so each one checks out (and then pools) its own connection
+        for _ in range(connections):
+            t = threading.Thread(target=_ping, args=(origin,), daemon=True)
+            t.start()
+            threads.append(t)
+    for t in threads:
+        t.join()
+    logger.info(f"Warmed up {len(hosts)} host(s) x {connections} connection(s) in {time.monotonic() - started:.3f}s")
+
+
+def _keep_alive(hosts: list[str]):
+    """Ping the hosts now and then so idle connections don't get dropped before first use."""
+    deadline = time.monotonic() + KEEPALIVE_LIMIT
+    while not _first_use.wait(KEEPALIVE_INTERVAL):
+        if time.monotonic() > deadline:
+            logger.info("Warm connections were not used; no longer keeping them alive")
+            return
+        for origin in hosts:
+            _ping(origin)
+
+
+def start_warm_up(info_json_path: Path, connections: int = WARM_CONNECTIONS) -> threading.Thread:
+    """Warm up connections to the catalog hosts in the background. Returns immediately."""
+    def _run():
+        hosts = catalog_hosts(info_json_path)
+        warm_up(hosts, connections)
+        _keep_alive(hosts)
+
+    t = threading.Thread(target=_run, name="uildl-warm-up", daemon=True)
+    t.start()
+    return t
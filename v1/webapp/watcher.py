@@ -0,0 +1,217 @@
+# keeps the download cache in step with changes made outside the app
+# (files deleted or copied in through the file manager)
+import os
+import time
+import threading
+from pathlib import Path
+from setup.mylogging import LOGGER as logger
+
+try:
+    # inotify on Linux, FSEvents on macOS, ReadDirectoryChangesW on Windows
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+DEBOUNCE_SECONDS = 1.0    # apply a burst of events once it has been quiet this long
+MAX_DELAY_SECONDS = 10.0  # ...but don't hold changes back longer than this during a long copy
+POLL_INTERVAL = 5.0       # fallback: how often to check the directory mtime
+
+
+class _EventCollector(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self._watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._watcher.notify(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._watcher.notify(event.src_path)
+
+    def on_closed(self, event):
+        # a writer finished (inotify only); the size is final now
+        if not event.is_directory:
+            self._watcher.notify(event.src_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self._watcher.notify(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._watcher.notify(event.src_path)
+            self._watcher.notify(event.dest_path)
+
+
+class DirectoryWatcher:
+    """
+    Watches a single directory (not recursive).
+
+    With watchdog installed, file events are collected and on_change(paths) is
+    called with each debounced batch of touched paths. Without it (or if the OS
+    refuses a watch), the directory mtime is polled and on_rescan() is called once
+    it has moved and then held still for a quiet spell; on_rescan() returns the paths
+    it indexed.
+
+    A file can still be growing when its batch (or rescan) is applied: a copy that
+    paused, a platform that coalesces write events, or, when polling, any write
+    into an existing file. So every file applied is looked at again after one more
+    quiet spell, and again until its size stops changing; a changed size goes to
+    on_change().
+    """
+
+    def __init__(self, directory, on_change, on_rescan, ignore=()):
+        self.directory = Path(directory)
+        self._on_change = on_change
+        self._on_rescan = on_rescan
+        self._ignore = set(ignore)
+        self.mode = None
+
+        self._pending = set()
+        self._settling = {}  # path -> size at the last look, for files not seen to settle yet
+        self._first_event = None
+        self._last_event = None
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._observer = None
+        self._thread = None
+
+    def start(self):
+        if Observer is not None:
+            try:
+                self._observer = Observer()
+                self._observer.schedule(_EventCollector(self), str(self.directory), recursive=False)
+                self._observer.start()
+                self.mode = 'events'
+            except Exception as e:
+                # e.g. inotify watch limit reached, or a network share without notifications
+                logger.warning(f"Could not watch {self.directory} for changes ({e}); polling instead")
+                self._observer = None
+        if self._observer is None:
+            self.mode = 'polling'
+
+        target = self._apply_events if self.mode == 'events' else self._poll
+        self._thread = threading.Thread(target=target, name="uildl-dir-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {self.directory} for changes ({self.mode})")
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+
+    def notify(self, path):
+        """Record that path was created, modified, deleted or renamed."""
+        if os.path.basename(path) in self._ignore:
+            return
+        now = time.monotonic()
+        with self._cond:
+            self._pending.add(path)
+            self._last_event = now
+            if self._first_event is None:
+                self._first_event = now
+            self._cond.notify()
+
+    def discard_pending(self):
+        """Drop events not applied yet (e.g. the index was just reset and they predate it)."""
+        with self._cond:
+            self._pending.clear()
+            self._first_event = self._last_event = None
+
+    def _apply_events(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                # debounce: wait for a quiet spell, bounded by MAX_DELAY_SECONDS
+                while self._pending and not self._stopped:
+                    now = time.monotonic()
+                    wait = min(self._last_event + DEBOUNCE_SECONDS, self._first_event + MAX_DELAY_SECONDS) - now
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                batch, self._pending = self._pending, set()
+                self._first_event = self._last_event = None
+            if not batch:
+                continue
+            try:
+                self._on_change(batch)
+            except Exception as e:
+                logger.error(f"Error applying {len(batch)} file changes from {self.directory}: {e}")
+            self._recheck(batch)
+
+    def _recheck(self, batch):
+        """Queue the files of batch whose size moved since the last look (or weren't looked at yet)."""
+        self._settling = self._unsettled(batch)
+        for path in self._settling:
+            self.notify(path)
+
+    def _unsettled(self, paths):
+        """{path: size} of the paths whose size differs from the last look at them."""
+        settling = {}
+        for path in paths:
+            try:
+                size = os.stat(path).st_size
+            except OSError:
+                continue
+            if self._settling.get(path) != size:
+                settling[path] = size
+        return settling
+
+    def _wait(self, seconds):
+        """Sleep unless stopped; False once the watcher is stopped."""
+        with self._cond:
+            if not self._stopped:
+                self._cond.wait(seconds)
+            return not self._stopped
+
+    def _poll(self):
+        last_mtime = self._dir_mtime()
+        while True:
+            # files picked up by the last pass are looked at again sooner
+            if not self._wait(DEBOUNCE_SECONDS if self._settling else POLL_INTERVAL):
+                return
+            mtime = self._dir_mtime()
+            if mtime is None or mtime == last_mtime:
+                if self._settling:
+                    moved = self._unsettled(self._settling)
+                    self._settling = moved
+                    if moved:
+                        try:
+                            self._on_change(moved)
+                        except Exception as e:
+                            logger.error(f"Error applying {len(moved)} file changes from {self.directory}: {e}")
+                continue
+            # let a burst of creates and renames finish before rescanning, as the events mode does
+            started = time.monotonic()
+            while time.monotonic() - started < MAX_DELAY_SECONDS:
+                if not self._wait(DEBOUNCE_SECONDS):
+                    return
+                latest = self._dir_mtime()
+                if latest == mtime:
+                    break
+                mtime = latest
+            last_mtime = mtime
+            try:
+                paths = self._on_rescan()
+            except Exception as e:
+                logger.error(f"Error rescanning {self.directory}: {e}")
+                continue
+            # what the rescan indexed may still be being written (that doesn't move the directory mtime)
+            self._settling = {**self._settling, **self._unsettled(paths or ())}
+
+    def _dir_mtime(self):
+        try:
+            return os.stat(self.directory).st_mtime_ns
+        except OSError:
+            return None